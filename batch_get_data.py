@@ -1,13 +1,25 @@
-from typing import List, Any, Type, TypeVar
+import argparse
+import time
+from typing import List, Any, Callable, Iterator, NamedTuple, Optional, Type, TypeVar
+from sqlalchemy import inspect, tuple_
 from sqlalchemy.orm import Session
-from core.database import get_db as get_db_local
-from core.database_prod import get_db
+from core.database import get_metrics as get_local_metrics, session_scope as local_session_scope
+from core.database_prod import get_metrics, session_scope
+from core.writer import FILE_WRITERS, WRITERS, get_writer
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from model_prod import *
 from models import *
 
 Base = TypeVar('Base', bound=DeclarativeMeta)
-taget_db = next(get_db_local())
+
+DEFAULT_CHUNK_SIZE = 1000
+
+def apply_filters(query, db_model: Type[Base], filters: dict = None):
+    if filters:
+        for key, value in filters.items():
+            if hasattr(db_model, key):
+                query = query.filter(getattr(db_model, key) == value)
+    return query
 
 def batch_get_data(
     db_model: Type[Base],
@@ -16,12 +28,7 @@ def batch_get_data(
     limit: int = 100,
     filters: dict = None
 ) -> List[Any]:
-    query = db.query(db_model)
-    
-    if filters:
-        for key, value in filters.items():
-            if hasattr(db_model, key):
-                query = query.filter(getattr(db_model, key) == value)
+    query = apply_filters(db.query(db_model), db_model, filters)
     
     return query.offset(skip).limit(limit).all()
 
@@ -30,42 +37,232 @@ def get_all_data(
     db: Session,
     filters: dict = None
 ) -> List[Any]:
-    query = db.query(db_model)
-    
-    if filters:
-        for key, value in filters.items():
-            if hasattr(db_model, key):
-                query = query.filter(getattr(db_model, key) == value)
+    query = apply_filters(db.query(db_model), db_model, filters)
     
     return query.all()
 
+def iter_data(
+    db_model: Type[Base],
+    db: Session,
+    filters: dict = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    after: Optional[Any] = None,
+    stream: bool = False,
+    order_by: Optional[str] = None
+) -> Iterator[List[Any]]:
+    """
+    Yield the rows of db_model in primary key order, chunk_size at a time.
+
+    Pages by primary key (WHERE id > :last ORDER BY id LIMIT n) instead of
+    OFFSET, so every page costs the same however deep into the table it is.
+    With stream=True a single query is read through a server-side cursor
+    instead. `after` starts after the given primary key value.
+
+    With `order_by` (a column name such as "created_at") rows are paged by
+    that column with the primary key as tie-breaker, and `after` is a
+    (column value, primary key) pair. Pages are only cheap when the source
+    has a (column, primary key) index; without one every page is a full
+    scan and sort.
+    """
+    mapper = inspect(db_model)
+    pk = mapper.primary_key[0]
+    pk_attribute = mapper.get_property_by_column(pk).key
+    keys = [pk_attribute] if order_by is None or order_by == pk_attribute else [order_by, pk_attribute]
+    columns = [getattr(db_model, key) for key in keys]
+    query = apply_filters(db.query(db_model), db_model, filters).order_by(*columns)
+
+    def after_clause(last):
+        if len(columns) == 1:
+            return columns[0] > last
+        # Row-value comparison, which MySQL can resolve as one range scan
+        # of a (column, primary key) index
+        return tuple_(*columns) > tuple_(*last)
+
+    if stream:
+        if after is not None:
+            query = query.filter(after_clause(after))
+        result = db.execute(query.statement.execution_options(yield_per=chunk_size))
+        for chunk in result.scalars().partitions():
+            yield chunk
+        return
+
+    last = after
+    while True:
+        page = query if last is None else query.filter(after_clause(last))
+        chunk = page.limit(chunk_size).all()
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = [getattr(chunk[-1], key) for key in keys]
+        last = last[0] if len(last) == 1 else tuple(last)
+
 def get_table_data(model: Type[Base], skip: int = 0, limit: int = 100, filters: dict = None) -> List[Any]:
-    db = next(get_db())
-    try:
+    with session_scope() as db:
         return batch_get_data(model, db, skip, limit, filters)
-    finally:
-        db.close()
 
 def get_all_table_data(model: Type[Base], filters: dict = None) -> List[Any]:
-    db = next(get_db())
-    try:
+    with session_scope() as db:
         return get_all_data(model, db, filters)
-    finally:
-        db.close()
-
-# data = get_table_data(ChatMessage, filters={"is_eval": True})
-chat_message = get_all_table_data(ChatMessage)
-i=0
-for chat in chat_message:
-    i+=1
-    d = User(
-            external_id=chat.id,
-            external_id_delete_flag=0,
-            username="hello" +f'{i}',
-            internal_user_flag=True,
-            created_at=datetime.now(),
+
+def iter_table_data(
+    model: Type[Base],
+    filters: dict = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    after: Optional[Any] = None,
+    stream: bool = False,
+    order_by: Optional[str] = None
+) -> Iterator[List[Any]]:
+    """iter_data() over its own source session, in constant memory"""
+    with session_scope() as db:
+        yield from iter_data(model, db, filters, chunk_size, after, stream, order_by)
+
+def chat_message_to_user(chat: ChatMessage) -> dict:
+    return dict(
+        external_id=chat.id,
+        external_id_delete_flag=0,
+        username=f"hello{chat.id}",
+        internal_user_flag=True,
+        created_at=datetime.now(),
+    )
+
+def auth_user_to_user(user: AuthUser) -> dict:
+    return dict(
+        external_id=user.id,
+        external_id_delete_flag=not user.is_active,
+        username=user.username,
+        internal_user_flag=True,
+        created_at=user.date_joined,
+    )
+
+def chat_conversation_to_conversation(conversation: ChatConversation) -> dict:
+    return dict(
+        external_id=conversation.id,
+        user_id=conversation.user_id,
+        topic=conversation.topic,
+        created_at=conversation.created_at,
+        model_id=conversation.model_id,
+        display_flag=not conversation.is_delete,
+    )
+
+def chat_message_to_message(chat: ChatMessage) -> dict:
+    return dict(
+        external_id=chat.id,
+        conversation_id=chat.conversation_id,
+        message=chat.message,
+        is_bot=chat.is_bot,
+        created_at=chat.created_at,
     )
 
-    taget_db.add(d)
-    taget_db.commit()
-taget_db.close()
\ No newline at end of file
+class SyncJob(NamedTuple):
+    source_model: Type[Base]
+    target_model: Type[Base]
+    # Maps one source row to a target row dict
+    transform: Callable[[Any], dict]
+    # Source column incremental runs page by: "id", or an append-only
+    # timestamp that has a (timestamp, id) index on the source table
+    watermark: str = "id"
+
+# The source tables are append-only with autoincrement ids, and their
+# timestamps are not indexed, so every job pages by id
+SYNC_JOBS = {
+    "chat_message_to_user": SyncJob(ChatMessage, User, chat_message_to_user),
+    "auth_user": SyncJob(AuthUser, User, auth_user_to_user),
+    "chat_conversation": SyncJob(ChatConversation, Conversation, chat_conversation_to_conversation),
+    "chat_message": SyncJob(ChatMessage, Message, chat_message_to_message),
+}
+
+def load_checkpoint(db: Session, job: str, source_model: Type[Base], watermark: str) -> SyncCheckpoint:
+    checkpoint = db.query(SyncCheckpoint).filter(SyncCheckpoint.job == job).first()
+    if checkpoint is None:
+        checkpoint = SyncCheckpoint(
+            job=job,
+            source_table=source_model.__tablename__,
+            watermark_column=watermark,
+            row_count=0,
+        )
+        db.add(checkpoint)
+    elif checkpoint.watermark_column != watermark:
+        raise ValueError(
+            f"Checkpoint for {job!r} pages by {checkpoint.watermark_column!r}, not {watermark!r}; "
+            f"reset it before changing the watermark"
+        )
+    return checkpoint
+
+def sync_table(
+    source_model: Type[Base],
+    target_model: Type[Base],
+    transform: Callable[[Any], dict],
+    filters: dict = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    stream: bool = False,
+    mode: str = "core",
+    checkpoint: Optional[str] = None,
+    watermark: str = "id"
+) -> int:
+    """
+    Copy source_model rows from prod into target_model locally. Source rows
+    are read in keyset-paginated chunks, mapped with `transform`, and each
+    chunk is written with one multi-row INSERT in a single transaction.
+    Returns the number of rows written.
+
+    With `checkpoint` (a job name) the run is incremental: it starts after
+    the high-water mark stored in sync_checkpoints for that job, pages by
+    the `watermark` column, and advances the mark in the same transaction
+    as each chunk, so a failed run resumes after its last committed chunk.
+    Full copies page by primary key whatever the watermark. A watermark
+    other than the primary key needs a (watermark, primary key) index on
+    the source, see iter_data().
+    """
+    with local_session_scope() as target_db:
+        writer = get_writer(target_db, target_model, mode, chunk_size)
+        pk_attribute = inspect(source_model).get_property_by_column(inspect(source_model).primary_key[0]).key
+        # Full copies always page by primary key
+        order_by = None if checkpoint is None or watermark == pk_attribute else watermark
+
+        state = None
+        after = None
+        if checkpoint is not None:
+            state = load_checkpoint(target_db, checkpoint, source_model, watermark)
+            if state.last_id is not None:
+                after = state.last_id if order_by is None else (state.last_value, state.last_id)
+                print(f"Resuming {checkpoint} after {watermark}={state.last_value or state.last_id}")
+
+        count = 0
+        started = time.perf_counter()
+        for chunk in iter_table_data(source_model, filters, chunk_size, after, stream, order_by):
+            if state is not None:
+                # Flushed and committed together with the chunk's INSERT
+                state.last_id = getattr(chunk[-1], pk_attribute)
+                state.last_value = getattr(chunk[-1], order_by) if order_by else None
+                state.row_count += len(chunk)
+            writer.write([transform(row) for row in chunk])
+            count += len(chunk)
+            elapsed = time.perf_counter() - started
+            print(f"Synced {count} {source_model.__tablename__} rows into {target_model.__tablename__} "
+                  f"({count / elapsed:.0f} rows/sec)")
+
+        if state is not None and count == 0:
+            # Persist a new checkpoint even when there was nothing to copy
+            target_db.commit()
+        print(f"Connection pools: local {get_local_metrics()}; prod {get_metrics()}")
+        return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy prod tables into the local database")
+    parser.add_argument("job", nargs="?", choices=list(SYNC_JOBS), default="chat_message_to_user")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="rows read and written per transaction")
+    parser.add_argument("--stream", action="store_true",
+                        help="read the source through a server-side cursor instead of keyset pages")
+    parser.add_argument("--mode", choices=[mode for mode in WRITERS if mode not in FILE_WRITERS], default="core",
+                        help="writer used for the target table")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only copy rows past the job's checkpoint and advance it per chunk")
+    args = parser.parse_args()
+
+    job = SYNC_JOBS[args.job]
+    sync_table(job.source_model, job.target_model, job.transform, chunk_size=args.chunk_size,
+               stream=args.stream, mode=args.mode,
+               checkpoint=args.job if args.incremental else None, watermark=job.watermark)
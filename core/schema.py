@@ -0,0 +1,170 @@
+import time
+from typing import Iterable, List
+
+from sqlalchemy import Column, ForeignKeyConstraint, MetaData, Table, UniqueConstraint, and_, exists, func, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import AddConstraint, CreateIndex, CreateTable
+
+# Dialects whose keys are added with one multi-clause ALTER TABLE. Elsewhere
+# (SQLite) unique constraints and foreign keys stay inline in CREATE TABLE
+# and only the indexes are deferred.
+ALTER_DIALECTS = {"mysql", "mariadb"}
+# Offending values shown per unique or foreign key in error reports
+ERROR_SAMPLE_SIZE = 5
+
+
+class DuplicateKeyError(ValueError):
+    """Rows loaded with deferred indexes violate one or more unique keys"""
+
+    def __init__(self, duplicates):
+        self.duplicates = duplicates
+        super().__init__("Cannot build unique indexes, duplicate values found:\n" + "\n".join(
+            f"  {table}({', '.join(columns)}): {count} duplicated values, e.g. {samples}"
+            for table, columns, count, samples in duplicates
+        ))
+
+
+class OrphanRowsError(ValueError):
+    """Rows reference parent keys that do not exist"""
+
+    def __init__(self, orphans):
+        self.orphans = orphans
+        super().__init__("Referential integrity check failed:\n" + "\n".join(
+            f"  {table}({', '.join(columns)}) -> {referred}: {count} orphan rows, e.g. {samples}"
+            for table, columns, referred, count, samples in orphans
+        ))
+
+
+def _can_alter(engine: Engine) -> bool:
+    return engine.dialect.name in ALTER_DIALECTS
+
+
+def _bare_table(table: Table) -> Table:
+    """Copy of `table` with its columns and primary key only"""
+    return Table(table.name, MetaData(), *(
+        Column(
+            column.name,
+            column.type,
+            primary_key=column.primary_key,
+            nullable=column.nullable,
+            autoincrement=column.autoincrement,
+            server_default=column.server_default.arg if column.server_default is not None else None,
+        )
+        for column in table.columns
+    ))
+
+
+def _unique_keys(table: Table) -> List[List[Column]]:
+    keys = [list(index.columns) for index in table.indexes if index.unique]
+    keys += [list(constraint.columns) for constraint in table.constraints if isinstance(constraint, UniqueConstraint)]
+    return keys
+
+
+def create_tables_deferred(engine: Engine, tables: Iterable[Table]):
+    """
+    Create `tables` without secondary indexes, unique keys or foreign keys,
+    so bulk inserts only maintain the primary key. Call build_deferred()
+    with the same tables once the data is loaded.
+    """
+    with engine.begin() as connection:
+        for table in tables:
+            if _can_alter(engine):
+                connection.execute(CreateTable(_bare_table(table)))
+            else:
+                connection.execute(CreateTable(table))
+
+
+def find_duplicates(connection: Connection, table: Table) -> list:
+    """(table, columns, duplicated value count, samples) for each violated unique key"""
+    duplicates = []
+    for columns in _unique_keys(table):
+        duplicated = (
+            select(*columns)
+            .group_by(*columns)
+            .having(func.count() > 1)
+            .subquery()
+        )
+        count = connection.scalar(select(func.count()).select_from(duplicated))
+        if count:
+            samples = connection.execute(select(duplicated).limit(ERROR_SAMPLE_SIZE)).all()
+            duplicates.append((table.name, [c.name for c in columns], count,
+                               [row[0] if len(row) == 1 else tuple(row) for row in samples]))
+    return duplicates
+
+
+def build_deferred(engine: Engine, tables: Iterable[Table]):
+    """
+    Build the unique keys, indexes and foreign keys left out by
+    create_tables_deferred(). Unique keys are checked with one GROUP BY per
+    key first and DuplicateKeyError lists every violation. On MySQL all keys
+    of a table are added in one ALTER TABLE, i.e. one pass over its rows;
+    foreign keys follow once every referenced column is indexed.
+    """
+    tables = list(tables)
+    with engine.connect() as connection:
+        duplicates = [d for table in tables for d in find_duplicates(connection, table)]
+    if duplicates:
+        raise DuplicateKeyError(duplicates)
+
+    preparer = engine.dialect.identifier_preparer
+    ddl_compiler = engine.dialect.ddl_compiler(engine.dialect, None)
+    with engine.begin() as connection:
+        for table in tables:
+            started = time.perf_counter()
+            if not _can_alter(engine):
+                for index in table.indexes:
+                    connection.execute(CreateIndex(index))
+            else:
+                clauses = [
+                    f"ADD {ddl_compiler.process(constraint)}"
+                    for constraint in table.constraints if isinstance(constraint, UniqueConstraint)
+                ]
+                clauses += [
+                    f"ADD {'UNIQUE ' if index.unique else ''}INDEX {preparer.format_index(index)} "
+                    f"({', '.join(preparer.quote(column.name) for column in index.columns)})"
+                    for index in table.indexes
+                ]
+                if clauses:
+                    connection.exec_driver_sql(f"ALTER TABLE {preparer.format_table(table)} {', '.join(clauses)}")
+            print(f"Built indexes on {table.name} in {time.perf_counter() - started:.1f}s")
+
+        if _can_alter(engine):
+            for table in tables:
+                for constraint in table.constraints:
+                    if isinstance(constraint, ForeignKeyConstraint):
+                        connection.execute(AddConstraint(constraint))
+
+
+def find_orphans(connection: Connection, table: Table) -> list:
+    """
+    (table, columns, referred table, orphan count, samples) for each foreign
+    key of `table` with rows whose non-NULL key has no parent, counted with
+    one NOT EXISTS query per key
+    """
+    orphans = []
+    for constraint in table.constraints:
+        if not isinstance(constraint, ForeignKeyConstraint):
+            continue
+        columns = [element.parent for element in constraint.elements]
+        missing_parent = and_(
+            *(column.isnot(None) for column in columns),
+            ~exists().where(*(element.parent == element.column for element in constraint.elements)),
+        )
+        count = connection.scalar(select(func.count()).select_from(table).where(missing_parent))
+        if count:
+            samples = connection.execute(
+                select(*columns).where(missing_parent).distinct().limit(ERROR_SAMPLE_SIZE)
+            ).all()
+            orphans.append((table.name, [c.name for c in columns], constraint.referred_table.name, count,
+                            [row[0] if len(row) == 1 else tuple(row) for row in samples]))
+    return orphans
+
+
+def check_integrity(engine: Engine, tables: Iterable[Table]):
+    """Raise OrphanRowsError listing every foreign key of `tables` with orphan rows"""
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        orphans = [o for table in tables for o in find_orphans(connection, table)]
+    if orphans:
+        raise OrphanRowsError(orphans)
+    print(f"Referential integrity verified in {time.perf_counter() - started:.1f}s")
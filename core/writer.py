@@ -0,0 +1,466 @@
+import csv
+import os
+import queue
+import tempfile
+import threading
+import uuid
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Type
+
+from sqlalchemy import insert, or_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+
+# Rows per INSERT round trip. PyMySQL rewrites executemany() into a single
+# multi-row INSERT ... VALUES statement, so this also bounds the packet size.
+DEFAULT_BATCH_SIZE = 5000
+# Batches waiting for the writer thread; bounds memory when the database
+# falls behind generation.
+DEFAULT_QUEUE_SIZE = 4
+# Server warnings quoted when a LOAD DATA batch does not load cleanly
+LOAD_DATA_WARNING_SAMPLE = 5
+
+
+class WriterStage:
+    """
+    Runs batch writes on a background thread fed through a bounded queue, so
+    row generation and database I/O overlap. Batches are written in the order
+    they were submitted, which keeps parent rows ahead of their children.
+    The session used by the writers must not be touched by the submitting
+    thread while the stage is open.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, name="writer-stage", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            writer, rows = item
+            # After a failure keep draining so the producer never blocks
+            if self.error is None:
+                try:
+                    if rows is None:
+                        writer()
+                    else:
+                        writer.write(rows)
+                except BaseException as e:
+                    self.error = e
+
+    def submit(self, writer: "Writer", rows: List[Dict[str, Any]]):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((writer, rows))
+
+    def call(self, callback: Callable[[], Any]):
+        """
+        Run `callback` on the writer thread once every batch submitted so
+        far is written, e.g. to record a checkpoint with the same session
+        """
+        if self.error is not None:
+            raise self.error
+        self.queue.put((callback, None))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Let pending batches finish but report the original error
+            self.queue.put(None)
+            self.thread.join()
+
+
+class Writer:
+    """
+    Buffers row dicts for one table and writes them in batches, either inline
+    or through a WriterStage when one is given.
+    """
+
+    def __init__(self, db: Session, model: Type[Any], batch_size: int = DEFAULT_BATCH_SIZE,
+                 stage: Optional[WriterStage] = None):
+        self.db = db
+        self.model = model
+        self.batch_size = batch_size
+        self.stage = stage
+        self.rows: List[Dict[str, Any]] = []
+        self.count = 0
+
+    def add(self, row: Dict[str, Any]):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def add_all(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.stage is not None:
+            self.stage.submit(self, self.rows)
+        else:
+            self.write(self.rows)
+        self.count += len(self.rows)
+        self.rows = []
+
+    def write(self, rows: List[Dict[str, Any]]):
+        """Write one batch of rows in a single transaction"""
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+
+class OrmWriter(Writer):
+    """
+    Adds one ORM object per row through the session unit of work. The
+    batch's objects are expunged once committed, so the session never holds
+    more than one batch of them; other objects in the session are kept.
+    """
+
+    def write(self, rows: List[Dict[str, Any]]):
+        objects = [self.model(**row) for row in rows]
+        self.db.add_all(objects)
+        self.db.commit()
+        for obj in objects:
+            self.db.expunge(obj)
+
+
+class CoreWriter(Writer):
+    """Sends each batch as one executemany INSERT through SQLAlchemy Core"""
+
+    def __init__(self, db: Session, model: Type[Any], batch_size: int = DEFAULT_BATCH_SIZE,
+                 stage: Optional[WriterStage] = None):
+        super().__init__(db, model, batch_size, stage)
+        self.statement = insert(model.__table__)
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self.db.execute(self.statement, rows)
+        self.db.commit()
+
+
+class UpsertWriter(Writer):
+    """
+    Inserts each batch with one executemany INSERT that updates rows whose
+    key already exists: ON DUPLICATE KEY UPDATE on MySQL/MariaDB and
+    ON CONFLICT DO UPDATE on SQLite/PostgreSQL. The key is external_id when
+    the table has one, otherwise its single-column unique key. Only the
+    columns present in the rows are updated, so server defaults such as
+    created_at are kept on re-loads.
+    """
+
+    KEY = "external_id"
+
+    def __init__(self, db: Session, model: Type[Any], batch_size: int = DEFAULT_BATCH_SIZE,
+                 stage: Optional[WriterStage] = None):
+        super().__init__(db, model, batch_size, stage)
+        self.table = model.__table__
+        self.key = self._find_key(self.table)
+        self.statements = {}
+
+    @classmethod
+    def _find_key(cls, table):
+        if cls.KEY in table.c:
+            return cls.KEY
+        for column in table.c:
+            if column.unique and not column.primary_key:
+                return column.name
+        raise ValueError(f"{table.name} has no external_id or unique column to upsert on")
+
+    def _statement(self, columns):
+        dialect = self.db.get_bind().dialect.name
+        update_columns = [c for c in columns if c != self.key and not self.table.c[c].primary_key]
+        if dialect in ("mysql", "mariadb"):
+            statement = mysql.insert(self.table)
+            # Rows whose values are unchanged count as 0 affected rows and
+            # are not rewritten by InnoDB
+            return statement.on_duplicate_key_update({c: statement.inserted[c] for c in update_columns})
+        if dialect in ("sqlite", "postgresql"):
+            statement = (sqlite if dialect == "sqlite" else postgresql).insert(self.table)
+            if not update_columns:
+                return statement.on_conflict_do_nothing(index_elements=[self.key])
+            # Skip the write for rows that did not change
+            return statement.on_conflict_do_update(
+                index_elements=[self.key],
+                set_={c: statement.excluded[c] for c in update_columns},
+                where=or_(*(self.table.c[c].is_distinct_from(statement.excluded[c]) for c in update_columns)),
+            )
+        raise ValueError(f"Upsert is not supported on {dialect}")
+
+    def write(self, rows: List[Dict[str, Any]]):
+        columns = tuple(rows[0])
+        if columns not in self.statements:
+            self.statements[columns] = self._statement(columns)
+        self.db.execute(self.statements[columns], rows)
+        self.db.commit()
+
+
+# MySQL's default LOAD DATA escaping: FIELDS ESCAPED BY '\\', with \N for NULL
+TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+TSV_UNESCAPES = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r", "0": "\0"}
+TSV_NULL = "\\N"
+
+
+def tsv_field(value: Any) -> str:
+    """Encode one value the way LOAD DATA reads it by default"""
+    if value is None:
+        return TSV_NULL
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value).translate(TSV_ESCAPES)
+
+
+def tsv_unescape(field: str) -> Optional[str]:
+    """Decode a tsv_field() back into its text, or None for NULL"""
+    if field == TSV_NULL:
+        return None
+    if "\\" not in field:
+        return field
+    parts = []
+    chars = iter(field)
+    for char in chars:
+        if char == "\\":
+            escaped = next(chars, "")
+            parts.append(TSV_UNESCAPES.get(escaped, escaped))
+        else:
+            parts.append(char)
+    return "".join(parts)
+
+
+def read_tsv(path: str) -> Iterator[List[Optional[str]]]:
+    """Yield the unescaped fields of each line of a tsv_field() file"""
+    with open(path, encoding="utf-8", newline="\n") as f:
+        for line in f:
+            yield [tsv_unescape(field) for field in line.rstrip("\n").split("\t")]
+
+
+class LoadDataWriter(Writer):
+    """
+    Stages each batch in a temporary UTF-8 TSV file and loads it with
+    LOAD DATA LOCAL INFILE, which needs local_infile enabled on the server
+    and the client (see core.database.make_engine). A batch that loads fewer
+    rows than it holds or raises warnings fails with ValueError and is not
+    committed. Rows are only inserted, never updated. On other databases the
+    file is read back and inserted with executemany, so the same encoding
+    is exercised, e.g. by tests on SQLite.
+    """
+
+    DIALECTS = {"mysql", "mariadb"}
+
+    def __init__(self, db: Session, model: Type[Any], batch_size: int = DEFAULT_BATCH_SIZE,
+                 stage: Optional[WriterStage] = None, staging_dir: Optional[str] = None):
+        super().__init__(db, model, batch_size, stage)
+        self.table = model.__table__
+        self.staging_dir = staging_dir
+
+    def write(self, rows: List[Dict[str, Any]]):
+        columns = list(rows[0])
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="\n", suffix=".tsv",
+                                         prefix=f"{self.table.name}-", dir=self.staging_dir,
+                                         delete=False) as f:
+            path = f.name
+            for row in rows:
+                f.write("\t".join(tsv_field(row[column]) for column in columns))
+                f.write("\n")
+        try:
+            if self.db.get_bind().dialect.name in self.DIALECTS:
+                self._load_data(path, columns, len(rows))
+            else:
+                self._insert_tsv(path, columns)
+            self.db.commit()
+        finally:
+            os.remove(path)
+
+    def _load_data(self, path: str, columns: List[str], row_count: int):
+        preparer = self.db.get_bind().dialect.identifier_preparer
+        connection = self.db.connection()
+        result = connection.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {preparer.format_table(self.table)} "
+            "CHARACTER SET utf8mb4 "
+            "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+            "LINES TERMINATED BY '\\n' "
+            f"({', '.join(preparer.quote(column) for column in columns)})",
+            (path,),
+        )
+        # With LOCAL the server cannot stop the client mid-file, so duplicate
+        # keys and bad values only skip or truncate rows with a warning
+        warning_count = connection.exec_driver_sql("SHOW COUNT(*) WARNINGS").scalar()
+        if result.rowcount != row_count or warning_count:
+            warnings = connection.exec_driver_sql(f"SHOW WARNINGS LIMIT {LOAD_DATA_WARNING_SAMPLE}").all()
+            raise ValueError(
+                f"LOAD DATA into {self.table.name} loaded {result.rowcount} of {row_count} rows "
+                f"with {warning_count} warnings, e.g. {[tuple(warning) for warning in warnings]}"
+            )
+
+    def _insert_tsv(self, path: str, columns: List[str]):
+        parsers = [_tsv_parser(self.table.c[column].type.python_type) for column in columns]
+        rows = [
+            {column: None if value is None else parse(value)
+             for column, parse, value in zip(columns, parsers, fields)}
+            for fields in read_tsv(path)
+        ]
+        self.db.execute(insert(self.table), rows)
+
+
+def _tsv_parser(python_type):
+    if python_type is bool:
+        return lambda value: value == "1"
+    if python_type is datetime:
+        return datetime.fromisoformat
+    if python_type is date:
+        return date.fromisoformat
+    return python_type
+
+
+class FileWriter(Writer):
+    """
+    Writes each batch as one part file under <output_dir>/<table>/ instead of
+    a database, so `db` may be None. Part names carry a per-writer prefix,
+    so writers in several processes can share a table directory.
+    """
+
+    EXTENSION = None
+
+    def __init__(self, db: Optional[Session], model: Type[Any], batch_size: int = DEFAULT_BATCH_SIZE,
+                 stage: Optional[WriterStage] = None, output_dir: Optional[str] = None):
+        if output_dir is None:
+            raise ValueError(f"{type(self).__name__} needs an output_dir")
+        super().__init__(db, model, batch_size, stage)
+        self.table = model.__table__
+        self.directory = os.path.join(output_dir, self.table.name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.prefix = uuid.uuid4().hex[:8]
+        self.parts = 0
+
+    def write(self, rows: List[Dict[str, Any]]):
+        path = os.path.join(self.directory, f"part-{self.prefix}-{self.parts:05d}.{self.EXTENSION}")
+        self.parts += 1
+        # Write then rename, so readers never pick up a partial part
+        tmp_path = f"{path}.tmp"
+        self.write_file(tmp_path, rows)
+        os.replace(tmp_path, path)
+
+    def write_file(self, path: str, rows: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+
+def csv_field(value: Any) -> Any:
+    """Encode one value for CsvFileWriter"""
+    if value is None:
+        return TSV_NULL
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str):
+        return value.replace("\\", "\\\\")
+    return value
+
+
+class CsvFileWriter(FileWriter):
+    """
+    UTF-8 CSV part files with a header row, in the encoding MySQL's LOAD
+    DATA reads with its default escape character: NULL is \\N, backslashes
+    in text are doubled and booleans are 1/0. Load a part with
+
+        LOAD DATA INFILE '<part>' INTO TABLE <table> CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY '\\\\'
+        LINES TERMINATED BY '\\r\\n' IGNORE 1 LINES (<header columns>)
+
+    Other readers need to treat \\N as NULL and \\\\ as one backslash, e.g.
+    pandas.read_csv(part, na_values=[r"\\N"], keep_default_na=False) and
+    then undo the doubling in text columns.
+    """
+
+    EXTENSION = "csv"
+
+    def write_file(self, path: str, rows: List[Dict[str, Any]]):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(rows[0])
+            writer.writerows([csv_field(value) for value in row.values()] for row in rows)
+
+
+class ParquetFileWriter(FileWriter):
+    """
+    Parquet part files, one row group each, typed from the table's columns.
+    Needs the optional pyarrow package.
+    """
+
+    EXTENSION = "parquet"
+
+    def __init__(self, db: Optional[Session], model: Type[Any], batch_size: int = DEFAULT_BATCH_SIZE,
+                 stage: Optional[WriterStage] = None, output_dir: Optional[str] = None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("Parquet output needs pyarrow, install it with `pip install pyarrow`") from e
+        super().__init__(db, model, batch_size, stage, output_dir)
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.schemas = {}
+
+    def _schema(self, columns):
+        types = {
+            bool: self.pa.bool_(),
+            int: self.pa.int64(),
+            float: self.pa.float64(),
+            datetime: self.pa.timestamp("us"),
+            date: self.pa.date32(),
+        }
+        return self.pa.schema([
+            (column, types.get(self.table.c[column].type.python_type, self.pa.string()))
+            for column in columns
+        ])
+
+    def write_file(self, path: str, rows: List[Dict[str, Any]]):
+        columns = tuple(rows[0])
+        if columns not in self.schemas:
+            self.schemas[columns] = self._schema(columns)
+        table = self.pa.Table.from_pylist(rows, schema=self.schemas[columns])
+        self.pq.write_table(table, path, row_group_size=len(rows))
+
+
+WRITERS = {
+    "orm": OrmWriter,
+    "core": CoreWriter,
+    "upsert": UpsertWriter,
+    "load_data": LoadDataWriter,
+    "csv": CsvFileWriter,
+    "parquet": ParquetFileWriter,
+}
+# Modes that write files instead of a database
+FILE_WRITERS = {"csv", "parquet"}
+
+
+def get_writer(db: Session, model: Type[Any], mode: str = "core", batch_size: Optional[int] = None,
+               stage: Optional[WriterStage] = None, **options) -> Writer:
+    """
+    Return the writer registered under `mode` for the given model. `options`
+    go to the writer class, e.g. output_dir for the file writers.
+    """
+    if mode not in WRITERS:
+        raise ValueError(f"Unknown writer mode {mode!r}, expected one of {sorted(WRITERS)}")
+    return WRITERS[mode](db, model, batch_size or DEFAULT_BATCH_SIZE, stage, **options)
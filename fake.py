@@ -1,449 +1,949 @@
+import argparse
+import multiprocessing
+import os
 import random
+import shutil
+from array import array
+from contextlib import nullcontext
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from faker import Faker
-from core.database import get_db, engine, Base
+from sqlalchemy import and_, delete, exists, func, or_, select, update
+from core.database import Base, fast_load_session, get_engine, get_metrics, session_scope
+from core.schema import build_deferred, check_integrity, create_tables_deferred
+from core.writer import FILE_WRITERS, WriterStage, get_writer
+from text_pool import load_text_pool
+from timeline import ActivityCurve, thread_times
 from models import (
     User, Personnel, Organization, Conversation,
     Message, RoleType, EmployeeType,
-    FieldMapping, Abbreviation, CategoryMapping
+    FieldMapping, Abbreviation, CategoryMapping, Department, RunState
+)
+from profiles import DEFAULT_PROFILE, PROFILES, get_profile
+from sampler import ColumnSampler, KeyPool, UsernameAllocator, derive_seed
+from value import (
+    role_type, employee_type, abbreviation, FIELD_MAPPING, insurance_categories, EXCLUDE_ROLE_TYPE,
+    ORG_TYPES, REGIONS, YES_NO, MODEL_IDS
 )
-from value import role_type, employee_type, abbreviation, FIELD_MAPPING, insurance_categories, EXCLUDE_ROLE_TYPE
-import itertools
 
 # Initialize Faker
 fake = Faker('ja_JP')
 # Add more locales if needed for more diverse fake data
 fake_others = [Faker('en_US'), Faker('zh_CN'), Faker('ko_KR')]
+# Draws categorical columns (role types, regions, flags...) a chunk at a time
+sampler = ColumnSampler()
 
-def create_tables():
-    """Create all tables in database"""
-    # Drop all tables first to ensure clean state
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
-    print("Tables created successfully")
+# Writer used per table; tables not listed go through the ORM unit of work.
+# See core.writer.WRITERS for the available modes.
+DEFAULT_WRITER_MODES = {
+    Message.__tablename__: "core",
+}
+# Used when generate_data keeps existing tables: rows with a natural key are
+# upserted, so a re-run only rewrites rows that changed.
+UPSERT_WRITER_MODES = {
+    model.__tablename__: "upsert" for model in (Personnel, User, Conversation, Message)
+}
+# Bulk tables staged as TSV files and loaded with LOAD DATA LOCAL INFILE
+LOAD_DATA_WRITER_MODES = {
+    model.__tablename__: "load_data" for model in (Personnel, User, Conversation, Message)
+}
 
-def generate_data():
-    db = next(get_db())
-    try:
-        # Create tables
-        create_tables()
-        
-        # Insert Role Types
-        print("Generating role types...")
-        for rt in role_type:
-            if not db.query(RoleType).filter(RoleType.role_type == rt).first():
-                db.add(RoleType(role_type=rt))
-        db.commit()
-        
-        # Insert Employee Types
-        print("Generating employee types...")
-        for et in employee_type:
-            if not db.query(EmployeeType).filter(EmployeeType.employee_type == et).first():
-                db.add(EmployeeType(employee_type=et))
-        db.commit()
-        
-        # Define org_types for use later (without creating DB records)
-        org_types = ["本社", "営業", "各支店", "その他"]
-        
-        # Insert Insurance Categories
-        print("Generating category mappings...")
-        for category_group, category_group_label, main_category, main_category_label, chat_parameter_category, chat_parameter_category_label in insurance_categories:
-            db.add(CategoryMapping(
-                category_group=category_group,
-                category_group_label=category_group_label,
-                main_category=main_category,
-                main_category_label=main_category_label,
-                chat_parameter_category=chat_parameter_category,
-                chat_parameter_category_label=chat_parameter_category_label
-            ))
-        db.commit()
+# Usernames are copied from personnels to users, so both fit the shorter column
+USERNAME_MAX_LENGTH = User.__table__.c.username.type.length
 
-        # Insert Field Mappings
-        print("Generating field mappings...")
-        for field, field_detail in FIELD_MAPPING:
-            if not db.query(FieldMapping).filter(FieldMapping.field_detail == field_detail).first():
-                db.add(FieldMapping(field=field, field_detail=field_detail))
-        db.commit()
+# Bulk-loaded tables whose secondary indexes, unique keys and foreign keys
+# are built after the load when Profile.defer_indexes is set
+DEFERRED_INDEX_MODELS = (Organization, Personnel, User, Conversation, Message)
+
+# Table phases of generate_data in order, by run_states phase name
+TABLE_PHASES = [(model.__tablename__, model) for model in (Department, Organization, Personnel, User)]
+
+# innodb_log_buffer_size requested for the duration of a fast load
+FAST_LOAD_LOG_BUFFER_SIZE = 256 * 1024 * 1024
+
+# Window of created_at values before the run's reference time
+CREATED_AT_SPAN = timedelta(days=730)
+CONVERSATION_SPAN = timedelta(weeks=3)
 
-        # Insert Abbreviations
-        print("Generating abbreviations...")
-        for abbr in abbreviation:
-            if not db.query(Abbreviation).filter(Abbreviation.abbreviation == abbr).first():
-                db.add(Abbreviation(abbreviation=abbr))
+USER_ID_START = 1000
+CONVERSATION_ID_START = 2000
+# Every conversation owns a block of Profile.messages_per_conversation_block
+# message external_ids from here, so ranges of conversations can be
+# generated independently without colliding.
+MESSAGE_ID_START = 10000000
+# Rows per vectorized draw of the categorical columns
+COLUMN_CHUNK_SIZE = 1000
+
+# KeyPool of user (external_id, internal_user_flag), set in each worker process
+_worker_users = None
+
+
+def writer_for(db, model, writer_modes, batch_size=None, stage=None, output_dir=None):
+    """Return the writer configured for the model's table, writing files under `output_dir` if set"""
+    options = {"output_dir": output_dir} if output_dir else {}
+    return get_writer(db, model, writer_modes.get(model.__tablename__, "orm"), batch_size, stage, **options)
+
+
+def iter_lookup_tables():
+    """Yield (model, key columns, rows) for each static lookup table"""
+    yield RoleType, ("role_type",), [dict(role_type=rt) for rt in role_type]
+    yield EmployeeType, ("employee_type",), [dict(employee_type=et) for et in employee_type]
+    yield CategoryMapping, ("main_category", "chat_parameter_category"), [
+        dict(
+            category_group=category_group,
+            category_group_label=category_group_label,
+            main_category=main_category,
+            main_category_label=main_category_label,
+            chat_parameter_category=chat_parameter_category,
+            chat_parameter_category_label=chat_parameter_category_label,
+        )
+        for category_group, category_group_label, main_category, main_category_label, chat_parameter_category, chat_parameter_category_label in insurance_categories
+    ]
+    yield FieldMapping, ("field_detail",), [dict(field=field, field_detail=field_detail) for field, field_detail in FIELD_MAPPING]
+    yield Abbreviation, ("abbreviation",), [dict(abbreviation=abbr) for abbr in abbreviation]
+
+
+def insert_lookup_tables(db):
+    """Insert the lookup table rows whose key is not in the database yet"""
+    for model, keys, rows in iter_lookup_tables():
+        print(f"Generating {model.__tablename__}...")
+        for row in rows:
+            if not db.query(model).filter_by(**{key: row[key] for key in keys}).first():
+                db.add(model(**row))
         db.commit()
 
-        # Generate Organizations (500 records)
-        print("Generating organizations...")
-        organizations = []
-        for _ in range(500):
-            field_map = random.choice(FIELD_MAPPING)  # Random field mapping tuple
-            org = Organization(
-                external_department_code=fake.unique.bothify(text="?####"),
-                external_division_code=fake.bothify(text="###"),
-                external_section_code=fake.bothify(text="##"),
+
+def seeded_generators(seed):
+    """A random.Random, ColumnSampler, ja_JP Faker and the other-locale Fakers, all seeded from `seed`"""
+    faker = Faker('ja_JP')
+    faker.seed_instance(seed)
+    others = [Faker(locale) for locale in ('en_US', 'zh_CN', 'ko_KR')]
+    for other in others:
+        other.seed_instance(seed)
+    return random.Random(seed), ColumnSampler(seed), faker, others
+
+
+def iter_chunks(count, size=COLUMN_CHUNK_SIZE):
+    """Yield (start, size) pairs covering range(count)"""
+    for start in range(0, count, size):
+        yield start, min(size, count - start)
+
+
+def iter_departments(path):
+    """Yield department rows from an Excel sheet"""
+    # Only needed for profiles with a departments_file
+    import pandas as pd
+
+    df_departments = pd.read_excel(path)
+    for row in df_departments.itertuples(index=False):
+        yield dict(
+            external_department_code=row.external_department_code,
+            external_division_code=row.external_division_code,
+            branch=row.branch,
+            abbreviation=row.abbreviation
+        )
+
+
+def iter_organizations(count, faker=fake, columns=sampler, departments=None, now=None):
+    """
+    Yield organization rows. With a `departments` KeyPool of (department code,
+    division code, branch, abbreviation) each organization copies those from a
+    random department, otherwise they are synthesized. created_at falls in
+    the CREATED_AT_SPAN before `now`.
+    """
+    now = now or datetime.now()
+    for _, n in iter_chunks(count):
+        # Categorical columns are drawn for the whole chunk at once
+        field_maps = columns.column("field_mapping", FIELD_MAPPING, n)
+        regions = columns.column("region", REGIONS, n)
+        if departments is not None:
+            department_columns = zip(*columns.keys(departments, n))
+        else:
+            department_columns = (
+                (faker.unique.bothify(text="?####"), faker.bothify(text="###"), faker.city(), abbr)
+                for abbr in columns.column("abbreviation", abbreviation, n)
+            )
+
+        for field_map, region, (department_code, division_code, branch, abbr) in zip(field_maps, regions, department_columns):
+            yield dict(
+                external_department_code=department_code,
+                external_division_code=division_code,
+                external_section_code=faker.bothify(text="##"),
                 field=field_map[0],
                 field_detail=field_map[1],
-                region=random.choice(["東京", "大阪", "名古屋", "福岡", "札幌", "仙台", "広島", "京都"]),
-                branch=fake.city(),
-                abbreviation=random.choice(abbreviation),
-                created_at=fake.date_time_between(start_date='-2y', end_date='now')
+                region=region,
+                branch=branch,
+                abbreviation=abbr,
+                created_at=faker.date_time_between(start_date=now - CREATED_AT_SPAN, end_date=now)
             )
-            organizations.append(org)
-            db.add(org)
-        db.commit()
-        print(f"Created {len(organizations)} organizations")
-
-        # Generate Personnel (5000 records)
-        print("Generating personnel...")
-        personnel_list = []
-        total_personnel = 5000
-        
-        # First, ensure all abbreviations are used at least once
-        remaining_abbrs = abbreviation.copy()
-        initial_records = len(remaining_abbrs)
-        
-        # Create one record for each abbreviation
-        for abbr in remaining_abbrs[:initial_records]:
-            personnel = Personnel(
-                external_username=fake.unique.user_name(),
-                entry_year=random.randint(1980, 2025),
-                department_code=random.choice([org.external_department_code for org in organizations]),
-                branch_code=fake.bothify(text="###"),
-                head_office_name=fake.company(),
-                branch_name=abbr,  # Use each abbreviation exactly once
-                section_name=fake.company_suffix(),
-                sales_office_name=fake.company_suffix(),
-                organization_type=random.choice(org_types),
-                employee_type=random.choice(employee_type),
-                role_type=random.choice(role_type),
-                is_organization_head=random.choice(["はい", "いいえ"]),
-                is_department_head=random.choice(["はい", "いいえ"])
+
+
+def iter_personnel(count, organizations, faker=fake, columns=sampler, distinct_branch_names=None):
+    """
+    Yield personnel rows in random organizations of the `organizations`
+    KeyPool of department codes. The first `distinct_branch_names` records
+    (default: all) use each abbreviation once as branch name, the rest
+    choose them at random. Usernames are made unique by UsernameAllocator.
+    """
+    usernames = UsernameAllocator(USERNAME_MAX_LENGTH)
+    if distinct_branch_names is None:
+        distinct_branch_names = len(abbreviation)
+    distinct_branch_names = min(distinct_branch_names, len(abbreviation))
+
+    for start, n in iter_chunks(count):
+        branch_names = columns.column("abbreviation", abbreviation, n)
+        # Use each abbreviation exactly once first
+        for i in range(start, min(start + n, distinct_branch_names)):
+            branch_names[i - start] = abbreviation[i]
+
+        department_codes, = columns.keys(organizations, n)
+
+        chunk = zip(
+            department_codes,
+            columns.integers(1980, 2025, n),
+            branch_names,
+            columns.column("organization_type", ORG_TYPES, n),
+            columns.column("employee_type", employee_type, n),
+            columns.column("role_type", role_type, n),
+            columns.column("is_organization_head", YES_NO, n),
+            columns.column("is_department_head", YES_NO, n),
+        )
+        for department_code, entry_year, branch_name, organization_type, emp_type, rt, org_head, dept_head in chunk:
+            yield dict(
+                external_username=usernames.allocate(faker.user_name()),
+                entry_year=entry_year,
+                department_code=department_code,
+                branch_code=faker.bothify(text="###"),
+                head_office_name=faker.company(),
+                branch_name=branch_name,
+                section_name=faker.company_suffix(),
+                sales_office_name=faker.company_suffix(),
+                organization_type=organization_type,
+                employee_type=emp_type,
+                role_type=rt,
+                is_organization_head=org_head,
+                is_department_head=dept_head
             )
-            personnel_list.append(personnel)
-            db.add(personnel)
-        
-        # Generate remaining records with random abbreviations
-        batch_size = 500
-        remaining_count = total_personnel - initial_records
-        
-        for batch_start in range(0, remaining_count, batch_size):
-            batch_end = min(batch_start + batch_size, remaining_count)
-            print(f"Generating personnel batch {batch_start}-{batch_end} of {remaining_count}...")
-            
-            for _ in range(batch_end - batch_start):
-                personnel = Personnel(
-                    external_username=fake.unique.user_name(),
-                    entry_year=random.randint(1980, 2025),
-                    department_code=random.choice([org.external_department_code for org in organizations]),
-                    branch_code=fake.bothify(text="###"),
-                    head_office_name=fake.company(),
-                    branch_name=random.choice(abbreviation),  # Randomly choose from all abbreviations
-                    section_name=fake.company_suffix(),
-                    sales_office_name=fake.company_suffix(),
-                    organization_type=random.choice(org_types),
-                    employee_type=random.choice(employee_type),
-                    role_type=random.choice(role_type),
-                    is_organization_head=random.choice(["はい", "いいえ"]),
-                    is_department_head=random.choice(["はい", "いいえ"])
-                )
-                personnel_list.append(personnel)
-                db.add(personnel)
-            db.commit()
-        
-        print(f"Created {len(personnel_list)} personnel records")
-
-        # Generate Users (15000 records)
-        print("Generating users...")
-        users = []
-        user_batch_size = 1000
-        internal_user_count = len(personnel_list)
-        external_user_count = 15000 - internal_user_count
-        
-        # Track used usernames to ensure uniqueness
-        used_usernames = set()
-        
-        # Create internal users from personnel records (in batches)
-        for batch_start in range(0, internal_user_count, user_batch_size):
-            batch_end = min(batch_start + user_batch_size, internal_user_count)
-            print(f"Generating internal users batch {batch_start}-{batch_end} of {internal_user_count}...")
-            
-            batch_personnel = personnel_list[batch_start:batch_end]
-            for personnel in batch_personnel:
-                # Determine if this is a valid internal user based on your criteria
-                is_internal = True
-                
-                # Check organization_type is not None and role_type is not in EXCLUDE_ROLE_TYPE
-                if personnel.organization_type is None or personnel.role_type in EXCLUDE_ROLE_TYPE:
-                    is_internal = False
-                
-                # Store username in the set to track used names
-                used_usernames.add(personnel.external_username)
-                    
-                user = User(
-                    external_id=1000 + len(users),
-                    external_id_delete_flag=random.choice([True, False]),
-                    username=personnel.external_username,
-                    internal_user_flag=is_internal,  # Set based on our criteria
-                    created_at=fake.date_time_between(start_date='-2y', end_date='now')
-                )
-                users.append(user)
-                db.add(user)
-            db.commit()
-        
-        # Add external users (not in personnel system) - in batches
-        for batch_start in range(0, external_user_count, user_batch_size):
-            batch_end = min(batch_start + user_batch_size, external_user_count)
-            print(f"Generating external users batch {batch_start}-{batch_end} of {external_user_count}...")
-            
-            for i in range(batch_end - batch_start):
-                # Cycle through faker instances more frequently to avoid exhausting any single one
-                faker_idx = i % len(fake_others)
-                faker_instance = fake_others[faker_idx]
-                
-                # Create more variation in username generation
-                if i % 4 == 0:
-                    # Standard username
-                    base_username = faker_instance.user_name()
-                elif i % 4 == 1:
-                    # Username with digit suffix
-                    base_username = f"{faker_instance.first_name().lower()}_{random.randint(1, 9999)}"
-                elif i % 4 == 2:
-                    # Username with word
-                    base_username = f"{faker_instance.first_name().lower()}_{faker_instance.word()}"
+
+
+def iter_users(count, personnel, faker=fake, rng=random, others=fake_others, columns=sampler, now=None):
+    """
+    Yield one internal user per (username, organization_type, role_type) row
+    of the `personnel` KeyPool, then external users up to `count`, created in the
+    CREATED_AT_SPAN before `now`
+    """
+    now = now or datetime.now()
+    external_id = USER_ID_START
+
+    # External usernames must not collide with the personnel ones
+    usernames = UsernameAllocator(USERNAME_MAX_LENGTH)
+
+    # Create internal users from personnel records
+    for start, n in iter_chunks(len(personnel)):
+        delete_flags = columns.column("external_id_delete_flag", [True, False], n)
+
+        for (username, organization_type, personnel_role_type), delete_flag in zip(personnel.rows(start, start + n), delete_flags):
+            # Check organization_type is not None and role_type is not in EXCLUDE_ROLE_TYPE
+            is_internal = organization_type is not None and personnel_role_type not in EXCLUDE_ROLE_TYPE
+
+            usernames.reserve(username)
+
+            yield dict(
+                external_id=external_id,
+                external_id_delete_flag=delete_flag,
+                username=username,
+                internal_user_flag=is_internal,  # Set based on our criteria
+                created_at=faker.date_time_between(start_date=now - CREATED_AT_SPAN, end_date=now)
+            )
+            external_id += 1
+
+    # Add external users (not in personnel system)
+    external_count = count - len(personnel)
+    delete_flags = []
+    for i in range(external_count):
+        if not delete_flags:
+            delete_flags = columns.column("external_id_delete_flag", [True, False], min(COLUMN_CHUNK_SIZE, external_count - i))
+            delete_flags.reverse()
+
+        # Cycle through faker instances more frequently to avoid exhausting any single one
+        faker_instance = others[i % len(others)]
+
+        # Create more variation in username generation
+        if i % 4 == 0:
+            # Standard username
+            base_username = faker_instance.user_name()
+        elif i % 4 == 1:
+            # Username with digit suffix
+            base_username = f"{faker_instance.first_name().lower()}_{rng.randint(1, 9999)}"
+        elif i % 4 == 2:
+            # Username with word
+            base_username = f"{faker_instance.first_name().lower()}_{faker_instance.word()}"
+        else:
+            # Completely custom pattern
+            base_username = f"{faker_instance.lexify('??')}_{faker_instance.bothify('###?')}"
+
+        yield dict(
+            external_id=external_id,
+            external_id_delete_flag=delete_flags.pop(),
+            username=usernames.allocate(base_username),
+            internal_user_flag=False,  # External users
+            created_at=faker_instance.date_time_between(start_date=now - CREATED_AT_SPAN, end_date=now)
+        )
+        external_id += 1
+
+
+def iter_conversations(start, end, users, faker=fake, text=None, columns=sampler, now=None, activity=None):
+    """
+    Yield conversations [start, end) for random users of the `users` KeyPool
+    of (external_id, internal_user_flag). Topics come from `text` (a
+    TextSampler) when given, else from faker. created_at follows the
+    `activity` curve over the CONVERSATION_SPAN before `now`, ending a day
+    earlier.
+    """
+    now = now or datetime.now()
+    text = text or faker
+    activity = activity or ActivityCurve()
+    model_ids = columns.column("model_id", MODEL_IDS, end - start)
+    # Randomly choosing a user for each conversation
+    user_ids, internal_user_flags = columns.keys(users, end - start)
+    created_ats = activity.sample(columns.rng, now - CONVERSATION_SPAN, now - timedelta(days=1), end - start).tolist()
+    chunk = zip(range(start, end), model_ids, user_ids, internal_user_flags, created_ats)
+    for i, model_id, user_id, internal_user_flag, created_at in chunk:
+
+        yield dict(
+            external_id=CONVERSATION_ID_START + i,
+            user_id=user_id,
+            topic=f"対話 {i+1}: {text.sentence()}",
+            created_at=created_at,
+            model_id=model_id,
+            display_flag=internal_user_flag  # Set based on user's internal flag
+        )
+
+
+def iter_messages(conversations, first_message_id, quota, profile, faker=fake, text=None, columns=sampler):
+    """
+    Yield user/bot message pairs for a KeyPool of conversation (external_id,
+    created_at) until `quota` messages have been produced. The number of
+    pairs per conversation follows the profile, and each conversation uses
+    its own block of profile.messages_per_conversation_block external_ids
+    from `first_message_id`. Message times of all conversations are built
+    at once by thread_times() from the profile's reply and turn gaps.
+    """
+    text = text or faker
+
+    # Calculate approximately how many messages per conversation we need
+    avg_messages_per_conversation = profile.messages // profile.conversations
+    # Make sure it's an even number (for user-bot pairs)
+    if avg_messages_per_conversation % 2 == 1:
+        avg_messages_per_conversation += 1
+
+    # One category per conversation
+    categories = columns.column("insurance_category", insurance_categories, len(conversations))
+
+    # Randomize messages per conversation around the average
+    pairs = columns.rng.normal(avg_messages_per_conversation // 2, profile.pairs_stddev, len(conversations))
+    message_counts = 2 * np.clip(pairs.astype(np.int64), profile.min_pairs, profile.max_pairs)
+    # Stop before the first conversation that would start past the quota
+    n = int(np.count_nonzero(np.cumsum(message_counts) - message_counts < quota))
+    conversation_ids, created_ats = (column[:n] for column in conversations.columns)
+    message_counts = message_counts[:n]
+
+    # User message, reply gap, bot reply, turn gap, next user message, ...
+    times = thread_times(created_ats, message_counts, (profile.reply_gap, profile.turn_gap), columns.rng).tolist()
+
+    message_id = first_message_id
+    first = 0
+    for conversation_id, message_count, category_choice in zip(conversation_ids.tolist(), message_counts.tolist(), categories):
+        _, category_group_label,_, main_category_label,_, chat_parameter_category_label = category_choice
+
+        for i in range(message_count):
+            yield dict(
+                external_id=message_id + i,
+                conversation_id=conversation_id,
+                message=text.paragraph(),
+                # Odd messages are the bot's replies
+                is_bot=i % 2 == 1,
+                main_category=main_category_label,
+                category_group=category_group_label,
+                chat_parameter_category=chat_parameter_category_label,
+                created_at=times[first + i]
+            )
+
+        first += message_count
+        message_id += profile.messages_per_conversation_block
+
+
+RUN_PHASE = "run"
+
+
+def conversation_phase(start):
+    """run_states phase of the conversation range starting at `start`"""
+    return f"conversations:{start}"
+
+
+class RunCheckpoints:
+    """
+    Phase and chunk checkpoints of one generate_data run in the run_states
+    table, recorded once a phase's rows are committed, so an interrupted run
+    can be resumed with the same seed and reference time.
+    """
+
+    def __init__(self, db, profile, seed, now, kept_tables=False):
+        self.db = db
+        self.profile = profile
+        self.seed = seed
+        self.now = now
+        self.kept_tables = kept_tables
+        # Status by phase, so checking a phase needs no query
+        self.statuses = {}
+
+    @classmethod
+    def begin(cls, db, profile, seed, now, kept_tables=False):
+        """Start a new run, forgetting the checkpoints of any previous one"""
+        db.execute(delete(RunState))
+        checkpoints = cls(db, profile, seed, now, kept_tables)
+        checkpoints.record(RUN_PHASE, "started")
+        return checkpoints
+
+    @staticmethod
+    def last_run(db, profile, seed=None, reference_time=None):
+        """
+        The "run" row of the last run, or None. Raises ValueError if it used
+        another profile, or another seed or reference time when given.
+        """
+        run = db.scalar(select(RunState).where(RunState.phase == RUN_PHASE))
+        if run is not None:
+            for name, value, last in (("profile", profile.name, run.profile), ("seed", seed, run.seed),
+                                      ("reference time", reference_time, run.reference_time)):
+                if value is not None and value != last:
+                    raise ValueError(f"The last run used {name} {last}, not {value}")
+        return run
+
+    @classmethod
+    def resume(cls, db, profile, seed=None):
+        """Load the checkpoints of the last run, which must have used `profile`"""
+        run = cls.last_run(db, profile, seed)
+        if run is None:
+            raise ValueError("No generate_data run to resume")
+        if run.kept_tables:
+            # Its tables hold rows of earlier runs, so the committed rows of
+            # a phase cannot be counted, and its rows need upserting
+            raise ValueError("The last run kept its tables and cannot be resumed; re-run it with the tables kept")
+        checkpoints = cls(db, profile, run.seed, run.reference_time)
+        checkpoints.statuses = dict(db.execute(select(RunState.phase, RunState.status)).all())
+        return checkpoints
+
+    def is_done(self, phase):
+        return self.statuses.get(phase) == "done"
+
+    def is_started(self, phase):
+        return phase in self.statuses and not self.is_done(phase)
+
+    def record(self, phase, status, last_external_id=None, row_count=0):
+        """Set the phase's status and commit"""
+        state = self.db.scalar(select(RunState).where(RunState.phase == phase))
+        if state is None:
+            state = RunState(phase=phase, seed=self.seed, profile=self.profile.name, reference_time=self.now,
+                             kept_tables=self.kept_tables)
+            self.db.add(state)
+        state.status = status
+        state.last_external_id = last_external_id
+        state.row_count = row_count
+        self.db.commit()
+        self.statuses[phase] = status
+
+
+def load_rows(db, *columns, order_by):
+    """Projection of already generated rows, in generation order"""
+    return [tuple(row) for row in db.execute(select(*columns).order_by(order_by))]
+
+
+def delete_conversation_range(db, start, end, profile):
+    """Delete the rows an interrupted generate_conversation_range(start, end) committed"""
+    first_message_id = MESSAGE_ID_START + start * profile.messages_per_conversation_block
+    db.execute(delete(Message).where(
+        Message.external_id >= first_message_id,
+        Message.external_id < first_message_id + (end - start) * profile.messages_per_conversation_block,
+    ))
+    db.execute(delete(Conversation).where(
+        Conversation.external_id >= CONVERSATION_ID_START + start,
+        Conversation.external_id < CONVERSATION_ID_START + end,
+    ))
+    db.commit()
+
+
+def _init_worker(users):
+    global _worker_users
+    _worker_users = users
+    # The engine (and any fast_load_session listeners) come from the forked
+    # parent, but its connections must not be reused here
+    get_engine().dispose(close=False)
+
+
+def _generate_conversation_range_in_worker(args):
+    return generate_conversation_range(*args, users=_worker_users)
+
+
+def generate_conversation_range(start, end, profile, seed, writer_modes, text_pool_size=None, output_dir=None,
+                                now=None, users=None):
+    """
+    Generate conversations [start, end) and their messages with a dedicated
+    session and Faker instance, returning (conversation_count, message_count).
+    External IDs depend only on the range and all randomness on the run's
+    `seed` and `start`, so given the same users and `now` a range comes out
+    identical however, wherever and in whatever order it runs. The range is
+    recorded in run_states as started and, once committed, done. With
+    `text_pool_size`, topics and messages are sampled from the cached text
+    pool instead of being generated by Faker.
+    """
+    range_seed = derive_seed(seed, "conversations", start)
+    _, columns, faker, _ = seeded_generators(range_seed)
+    text = load_text_pool('ja_JP', text_pool_size).sampler(range_seed) if text_pool_size else faker
+
+    # This range's share of the message target
+    message_quota = profile.messages * (end - start) // profile.conversations
+
+    with session_scope() if output_dir is None else nullcontext() as db:
+        checkpoints = None
+        if db is not None:
+            checkpoints = RunCheckpoints(db, profile, seed, now)
+            checkpoints.record(conversation_phase(start), "started")
+
+        with WriterStage() as stage:
+            conversation_writer = writer_for(db, Conversation, writer_modes, profile.batch_size, stage, output_dir)
+            message_writer = writer_for(db, Message, writer_modes, profile.batch_size, stage, output_dir)
+
+            # Messages only need the key and start time of each conversation
+            conversation_ids = array("q")
+            conversation_times = []
+            for conversation in iter_conversations(start, end, users, faker, text, columns, now, profile.activity):
+                conversation_ids.append(conversation["external_id"])
+                conversation_times.append(conversation["created_at"])
+                conversation_writer.add(conversation)
+            conversation_writer.flush()
+
+            message_writer.add_all(iter_messages(
+                KeyPool(np.array(conversation_ids), np.array(conversation_times, dtype="datetime64[us]")),
+                MESSAGE_ID_START + start * profile.messages_per_conversation_block,
+                message_quota,
+                profile,
+                faker,
+                text,
+                columns,
+            ))
+            message_writer.flush()
+
+        if checkpoints is not None:
+            checkpoints.record(conversation_phase(start), "done", CONVERSATION_ID_START + end - 1, message_writer.count)
+        print(f"Generated conversations {start}-{end} with {message_writer.count} messages")
+        return conversation_writer.count, message_writer.count
+
+
+def create_tables(drop=True, defer_indexes=False):
+    """
+    Create all tables in database, dropping existing ones first unless `drop`
+    is False. With `defer_indexes` the DEFERRED_INDEX_MODELS tables get their
+    primary key only, until build_indexes() is called after the load.
+    """
+    engine = get_engine()
+    if drop:
+        Base.metadata.drop_all(bind=engine)
+    if defer_indexes:
+        deferred = [model.__table__ for model in DEFERRED_INDEX_MODELS]
+        Base.metadata.create_all(bind=engine, tables=[t for t in Base.metadata.sorted_tables if t not in deferred])
+        create_tables_deferred(engine, deferred)
+    else:
+        Base.metadata.create_all(bind=engine)
+    print("Tables created successfully")
+
+
+def prepare_output_dir(output_dir, clear=True):
+    """Create `output_dir`, removing the part files of every table first if `clear`"""
+    for table in Base.metadata.sorted_tables:
+        directory = os.path.join(output_dir, table.name)
+        if clear and os.path.isdir(directory):
+            shutil.rmtree(directory)
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Writing tables to {output_dir}")
+
+
+def build_indexes():
+    """Build the indexes and keys of the tables created with defer_indexes"""
+    print("Building deferred indexes and foreign keys...")
+    build_deferred(get_engine(), [model.__table__ for model in DEFERRED_INDEX_MODELS])
+
+
+def verify_integrity():
+    """
+    Check every foreign key of the bulk tables (Message.conversation_id,
+    Conversation.user_id, Personnel.department_code) for orphan rows
+    """
+    print("Verifying referential integrity...")
+    check_integrity(get_engine(), [model.__table__ for model in DEFERRED_INDEX_MODELS])
+
+def generate_data(profile=DEFAULT_PROFILE, writer_modes=None, batch_size=None, workers=None, seed=None,
+                  text_pool_size=None, drop_tables=True, defer_indexes=None, fast_load=False, output_dir=None,
+                  output_format="parquet", reference_time=None, resume=False):
+    """
+    Generate a full dataset sized by `profile` (a name from profiles.PROFILES
+    or a Profile). `batch_size` and `workers` override the profile's values.
+
+    Every table and conversation range draws from its own sub-seed of
+    `seed`, and timestamps are placed relative to `reference_time` instead
+    of the clock, so the same seed, reference time and profile produce the
+    same dataset for any number of workers. Both are printed at the start
+    so a run can be reproduced.
+
+    With `drop_tables=False` existing tables are kept and users, personnel,
+    conversations and messages are upserted on their natural key instead of
+    inserted. The seed and reference time default to those of the last run
+    recorded in run_states, and another seed, reference time or profile is
+    rejected, so a re-run regenerates the same rows and only rewrites those
+    that changed in the database since. Departments and organizations have
+    no natural key: only the rows past those already in the table are
+    inserted, so a complete table is left as is.
+
+    `defer_indexes` overrides the profile's setting of the same name; it only
+    applies when the tables are recreated, since upserts need the unique keys.
+
+    With `fast_load` the load runs inside core.database.fast_load_session(),
+    without foreign key and unique checks on MySQL, and verify_integrity()
+    checks the result afterwards. Unique checks stay on when tables are
+    upserted.
+
+    With `output_dir` no database is used: every table is written as
+    `output_format` ("parquet" or "csv") part files of batch_size rows under
+    <output_dir>/<table>/, replacing earlier parts unless `drop_tables` is
+    False.
+
+    Database runs record each finished phase and conversation range in
+    run_states. With `resume` the last run continues where it stopped, with
+    its own seed and reference time: finished phases are skipped, the
+    interrupted table phase regenerates its rows and only writes those past
+    the committed ones, and interrupted conversation ranges are deleted and
+    regenerated. Only runs that recreated the tables can be resumed; an
+    interrupted run with kept tables is completed by running it again.
+    """
+    profile = get_profile(profile, batch_size=batch_size, workers=workers, defer_indexes=defer_indexes)
+    if output_dir is not None:
+        if resume:
+            raise ValueError("Only database runs can be resumed")
+        if output_format not in FILE_WRITERS:
+            raise ValueError(f"Unknown output format {output_format!r}, expected one of {sorted(FILE_WRITERS)}")
+        writer_modes = {table.name: output_format for table in Base.metadata.sorted_tables}
+        defer_indexes = fast_load = False
+    else:
+        # A resumed run keeps its tables but inserts like the run it continues
+        upsert = not drop_tables and not resume
+        writer_modes = {**DEFAULT_WRITER_MODES, **(UPSERT_WRITER_MODES if upsert else {}), **(writer_modes or {})}
+        if upsert and "load_data" in writer_modes.values():
+            raise ValueError("load_data only inserts rows, it cannot update kept tables; drop them or upsert")
+        defer_indexes = profile.defer_indexes and drop_tables and not resume
+
+    # Upserts rely on unique key checks to find the rows they update
+    upserting = "upsert" in writer_modes.values()
+    fast_load_context = (fast_load_session(log_buffer_size=FAST_LOAD_LOG_BUFFER_SIZE, unique_checks=upserting)
+                         if fast_load else nullcontext())
+    with fast_load_context, (session_scope() if output_dir is None else nullcontext()) as db:
+        try:
+            checkpoints = None
+            committed = {}
+            if resume:
+                checkpoints = RunCheckpoints.resume(db, profile, seed)
+                seed, now = checkpoints.seed, checkpoints.now
+                defer_indexes = checkpoints.is_started("indexes")
+                # Rows of the interrupted table phase that are already
+                # committed, which is a prefix of what it generates
+                for phase, model in TABLE_PHASES:
+                    if not checkpoints.is_done(phase):
+                        committed[phase] = db.scalar(select(func.count()).select_from(model))
+                print(f"Resuming profile {profile.name} with seed {seed} and reference time {now.isoformat()}")
+            else:
+                if output_dir is None:
+                    # Create tables
+                    create_tables(drop=drop_tables, defer_indexes=defer_indexes)
+                    # Upserting into kept tables only converges on the data
+                    # they hold when regenerating it with the same seed and
+                    # reference time
+                    last_run = None if drop_tables else RunCheckpoints.last_run(db, profile, seed, reference_time)
+                    if last_run is not None:
+                        seed, reference_time = last_run.seed, last_run.reference_time
+                    if not drop_tables:
+                        # Departments and organizations have no natural key to
+                        # upsert on. A re-run regenerates the same rows, so
+                        # only those past the ones already loaded are written
+                        for model in (Department, Organization):
+                            committed[model.__tablename__] = db.scalar(select(func.count()).select_from(model))
+                        if last_run is None and committed[Organization.__tablename__] and (
+                                seed is None or reference_time is None):
+                            raise ValueError("The kept tables hold data of a run not recorded in run_states; "
+                                             "pass its seed and reference time or drop the tables")
+
+                if seed is None:
+                    seed = random.randrange(2**32)
+                now = reference_time or datetime.now().replace(microsecond=0)
+                print(f"Generating profile {profile.name} with seed {seed} and reference time {now.isoformat()}")
+
+                if output_dir is None:
+                    checkpoints = RunCheckpoints.begin(db, profile, seed, now, kept_tables=not drop_tables)
+                    if defer_indexes:
+                        checkpoints.record("indexes", "started")
                 else:
-                    # Completely custom pattern
-                    base_username = f"{faker_instance.lexify('??')}_{faker_instance.bothify('###?')}"
-                
-                # Ensure uniqueness by adding suffixes if needed
-                username = base_username
-                attempt = 0
-                while username in used_usernames:
-                    attempt += 1
-                    username = f"{base_username}_{attempt}"
-                    # If we're still having trouble, add more randomness
-                    if attempt > 5:
-                        username = f"{base_username}_{random.randint(1000, 9999)}"
-                
-                # Add to our tracking set
-                used_usernames.add(username)
-                
-                user = User(
-                    external_id=1000 + len(users),
-                    external_id_delete_flag=random.choice([True, False]),
-                    username=username,
-                    internal_user_flag=False,  # External users
-                    created_at=faker_instance.date_time_between(start_date='-2y', end_date='now')
-                )
-                users.append(user)
-                db.add(user)
-            db.commit()
-        
-        print(f"Created {len(users)} user records")
-
-        # Generate Conversations (25000 records)
-        print("Generating conversations...")
-        conversations = []
-        num_conversations = 25000
-        conv_batch_size = 1000
-        
-        for batch_start in range(0, num_conversations, conv_batch_size):
-            batch_end = min(batch_start + conv_batch_size, num_conversations)
-            print(f"Generating conversations {batch_start}-{batch_end} of {num_conversations}...")
-            
-            for i in range(batch_start, batch_end):
-                user = random.choice(users)  # Randomly choosing a user
-                
-                # Set display_flag based on internal_user_flag
-                display_flag = user.internal_user_flag
-                
-                conversation = Conversation(
-                    external_id=2000 + i,
-                    user_id=user.external_id,  # Using the selected user's external_id
-                    topic=f"対話 {i+1}: {fake.sentence()}",
-                    created_at=fake.date_time_between(start_date='-3w', end_date=datetime.now() - timedelta(days=1)),
-                    model_id=random.choice([3, 4, 5]),
-                    display_flag=display_flag  # Set based on user's internal flag
-                )
-                conversations.append(conversation)
-                db.add(conversation)
-            
-            # Commit after each batch
-            db.commit()
-            # Clear conversations list to free memory after committing
-            conversations = []
-                
-        db.commit()
-        print(f"Created {num_conversations} conversations")
-
-        # Generate Messages (1,000,000 records)
-        print("Generating messages...")
-        message_count = 0
-        target_message_count = 1000000
-        messages_per_batch = 10000
-        
-        # Create a set to track used external_ids
-        used_message_ids = set()
-        
-        # Or use a counter as a guaranteed unique ID source
-        id_counter = itertools.count(10000000)
-        
-        # Calculate approximately how many messages per conversation we need
-        avg_messages_per_conversation = target_message_count // num_conversations
-        # Make sure it's an even number (for user-bot pairs)
-        if avg_messages_per_conversation % 2 == 1:
-            avg_messages_per_conversation += 1
-        
-        print(f"Target: ~{avg_messages_per_conversation} messages per conversation")
-        
-        # Fetch conversations in batches to save memory
-        for conv_batch_start in range(0, num_conversations, 1000):
-            conv_batch_end = min(conv_batch_start + 1000, num_conversations)
-            print(f"Fetching conversations {conv_batch_start}-{conv_batch_end}...")
-            
-            # Get a batch of conversations from database
-            conv_batch = db.query(Conversation).filter(
-                Conversation.external_id >= (2000 + conv_batch_start),
-                Conversation.external_id < (2000 + conv_batch_end)
-            ).all()
-            
-            for conv_idx, conv in enumerate(conv_batch):
-                # Skip if we've reached our target
-                if message_count >= target_message_count:
-                    break
-                    
-                # Report progress periodically
-                if conv_idx % 50 == 0:
-                    print(f"Generating messages for conversation batch {conv_batch_start+conv_idx}... Total messages so far: {message_count}")
-                
-                # Randomize messages per conversation around the average
-                pairs = max(2, min(100, int(random.normalvariate(avg_messages_per_conversation//2, 5))))
-                
-                current_time = conv.created_at
-                
-                # Randomly select a category for this conversation
-                category_choice = random.choice(insurance_categories)
-                _, category_group_label,_, main_category_label,_, chat_parameter_category_label = category_choice
-                
-                # Batch for this conversation
-                batch_msgs = []
-                
-                for _ in range(pairs):
-                    # User message
-                    chat_params = {
-                        "temperature": round(random.uniform(0.1, 1.0), 2),
-                        "max_tokens": random.randint(50, 2000),
-                        "model": random.choice(["gpt-3.5-turbo-ja", "gpt-4-ja", "claude-3-sonnet-ja"])
-                    }
-                    
-                    # Get a guaranteed unique ID using the counter
-                    external_id = next(id_counter)
-                    
-                    batch_msgs.append(Message(
-                        external_id=external_id,
-                        conversation_id=conv.external_id,
-                        message=fake.paragraph(),
-                        is_bot=False,
-                        chat_parameter=chat_params,
-                        main_category=main_category_label,
-                        category_group=category_group_label,
-                        chat_parameter_category=chat_parameter_category_label,
-                        created_at=current_time
-                    ))
-                    message_count += 1
-                    
-                    # Bot response (30-50 seconds later)
-                    current_time += timedelta(seconds=random.randint(30, 50))
-                    
-                    # Get next unique ID
-                    external_id = next(id_counter)
-                    
-                    batch_msgs.append(Message(
-                        external_id=external_id,
-                        conversation_id=conv.external_id,
-                        message=fake.paragraph(),
-                        is_bot=True,
-                        chat_parameter=chat_params,
-                        main_category=main_category_label,
-                        category_group=category_group_label,
-                        chat_parameter_category=chat_parameter_category_label,
-                        created_at=current_time
-                    ))
-                    message_count += 1
-                    
-                    # Add delay before next pair
-                    current_time += timedelta(minutes=random.randint(1, 10))
-                
-                # Add all messages for this conversation
-                for msg in batch_msgs:
-                    db.add(msg)
-                
-                # Commit every batch_size messages to avoid huge transactions
-                if message_count % messages_per_batch < len(batch_msgs):
-                    db.commit()
-                    print(f"Committed batch of messages. Total: {message_count}")
-                
-        # Final commit for any remaining messages
-        db.commit()
-        print(f"Created {message_count} message records")
+                    prepare_output_dir(output_dir, clear=drop_tables)
 
-        print("Data generation completed successfully!")
+            def is_done(phase):
+                return checkpoints is not None and checkpoints.is_done(phase)
 
-    except Exception as e:
-        print(f"Error generating data: {str(e)}")
-        db.rollback()
-    finally:
-        db.close()
+            if output_dir is None:
+                insert_lookup_tables(db)
+            else:
+                for model, _, rows in iter_lookup_tables():
+                    print(f"Writing {model.__tablename__}...")
+                    with writer_for(db, model, writer_modes, profile.batch_size, output_dir=output_dir) as writer:
+                        writer.add_all(rows)
 
-# Function to check and update display flags if needed
-def update_display_flags():
-    db = next(get_db())
-    try:
-        print("Updating display flags for conversations...")
-        
-        # Get all users
-        users = db.query(User).all()
-        updated_count = 0
-        
-        for user in users:
-            should_display = True
-            
-            # Check if user has a personnel record
-            personnel = db.query(Personnel).filter(Personnel.external_username == user.username).first()
-            if not personnel:
-                should_display = False
+            # Organizations, personnel and users are written by a background
+            # thread while the next rows are generated. Later phases only keep
+            # the few columns they need from earlier ones; for phases finished
+            # by an interrupted run those are read back from the database.
+            # Checkpoints go through the stage, after the phase's last batch.
+            with WriterStage() as stage:
+                def finish(phase, writer, last_external_id=None):
+                    if checkpoints is not None:
+                        row_count = committed.get(phase, 0) + writer.count
+                        stage.call(lambda: checkpoints.record(phase, "done", last_external_id, row_count))
+
+                # Load Department data from Excel file
+                departments = None
+                if profile.departments_file and is_done(Department.__tablename__):
+                    departments = KeyPool(*zip(*load_rows(
+                        db, Department.external_department_code, Department.external_division_code,
+                        Department.branch, Department.abbreviation, order_by=Department.id,
+                    )))
+                elif profile.departments_file:
+                    print("Loading department data from Excel...")
+                    skip = committed.get(Department.__tablename__, 0)
+                    department_columns = ([], [], [], [])
+                    with writer_for(db, Department, writer_modes, profile.batch_size, stage, output_dir) as department_writer:
+                        excel_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), profile.departments_file)
+                        for i, department in enumerate(iter_departments(excel_path)):
+                            for column, value in zip(department_columns, department.values()):
+                                column.append(value)
+                            if i >= skip:
+                                department_writer.add(department)
+                    finish(Department.__tablename__, department_writer)
+                    departments = KeyPool(*department_columns)
+                    print(f"Created {department_writer.count} department records")
+
+                # Generate Organizations
+                if is_done(Organization.__tablename__):
+                    organizations = KeyPool([row[0] for row in load_rows(
+                        db, Organization.external_department_code, order_by=Organization.id)])
+                else:
+                    print("Generating organizations...")
+                    skip = committed.get(Organization.__tablename__, 0)
+                    department_codes = []
+                    _, columns, faker, _ = seeded_generators(derive_seed(seed, "organizations"))
+                    with writer_for(db, Organization, writer_modes, profile.batch_size, stage, output_dir) as organization_writer:
+                        for i, org in enumerate(iter_organizations(profile.organizations, faker, columns, departments, now)):
+                            department_codes.append(org["external_department_code"])
+                            if i >= skip:
+                                organization_writer.add(org)
+                    finish(Organization.__tablename__, organization_writer)
+                    organizations = KeyPool(department_codes)
+                    print(f"Created {organization_writer.count} organizations")
+
+                # Generate Personnel
+                if is_done(Personnel.__tablename__):
+                    personnel = KeyPool(*zip(*load_rows(db, Personnel.external_username, Personnel.organization_type,
+                                                        Personnel.role_type, order_by=Personnel.id)))
+                else:
+                    print("Generating personnel...")
+                    skip = committed.get(Personnel.__tablename__, 0)
+                    usernames = []
+                    organization_types = []
+                    role_types = []
+                    _, columns, faker, _ = seeded_generators(derive_seed(seed, "personnels"))
+                    with writer_for(db, Personnel, writer_modes, profile.batch_size, stage, output_dir) as personnel_writer:
+                        for i, person in enumerate(iter_personnel(profile.personnel, organizations, faker, columns,
+                                                                  distinct_branch_names=profile.distinct_branch_names)):
+                            usernames.append(person["external_username"])
+                            organization_types.append(person["organization_type"])
+                            role_types.append(person["role_type"])
+                            if i >= skip:
+                                personnel_writer.add(person)
+                    finish(Personnel.__tablename__, personnel_writer)
+                    personnel = KeyPool(usernames, organization_types, role_types)
+                    print(f"Created {personnel_writer.count} personnel records")
+
+                # Generate Users
+                if is_done(User.__tablename__):
+                    users = KeyPool(*zip(*load_rows(db, User.external_id, User.internal_user_flag,
+                                                    order_by=User.external_id)))
+                else:
+                    print("Generating users...")
+                    skip = committed.get(User.__tablename__, 0)
+                    # Plain int64s rather than one Python int object per user
+                    user_ids = array("q")
+                    internal_user_flags = []
+                    rng, columns, faker, others = seeded_generators(derive_seed(seed, "users"))
+                    with writer_for(db, User, writer_modes, profile.batch_size, stage, output_dir) as user_writer:
+                        for i, user in enumerate(iter_users(profile.users, personnel, faker, rng, others, columns, now)):
+                            user_ids.append(user["external_id"])
+                            internal_user_flags.append(user["internal_user_flag"])
+                            if i >= skip:
+                                user_writer.add(user)
+                    finish(User.__tablename__, user_writer, user_ids[-1] if user_ids else None)
+                    users = KeyPool(np.array(user_ids), np.array(internal_user_flags))
+                    print(f"Created {user_writer.count} user records")
+
+            # Generate Conversations and Messages
+            print(f"Generating conversations and messages with {profile.workers} worker(s)...")
+
+            if text_pool_size:
+                # Build and cache the pool once, before workers try to load it
+                load_text_pool('ja_JP', text_pool_size)
+
+            ranges = []
+            for start in range(0, profile.conversations, profile.conversation_range_size):
+                end = min(start + profile.conversation_range_size, profile.conversations)
+                if is_done(conversation_phase(start)):
+                    continue
+                if checkpoints is not None and checkpoints.is_started(conversation_phase(start)):
+                    # Interrupted mid-range: drop its committed rows and redo it
+                    delete_conversation_range(db, start, end, profile)
+                ranges.append((start, end, profile, seed, writer_modes, text_pool_size, output_dir, now))
+            if resume:
+                print(f"{len(ranges)} conversation ranges left to generate")
+
+            if profile.workers > 1:
+                # Workers must be forked: they reach the configured engine, and
+                # fast-load mode, through the parent's state. spawn (macOS,
+                # and Linux from Python 3.14) would fall back to $DATABASE_URL.
+                with ProcessPoolExecutor(max_workers=profile.workers, mp_context=multiprocessing.get_context("fork"),
+                                         initializer=_init_worker, initargs=(users,)) as pool:
+                    results = list(pool.map(_generate_conversation_range_in_worker, ranges))
             else:
-                # Check if organization_type is null
-                if personnel.organization_type is None:
-                    should_display = False
-                # Check if role_type is in EXCLUDE_ROLE_TYPE
-                elif personnel.role_type in EXCLUDE_ROLE_TYPE:
-                    should_display = False
-            
-            # Update all conversations for this user if needed
-            if not should_display and user.internal_user_flag:
-                # Update user first
-                user.internal_user_flag = False
-                
-                # Get all conversations for this user
-                conversations = db.query(Conversation).filter(
-                    Conversation.user_id == user.external_id,
-                    Conversation.display_flag == True  # Only update those currently set to True
-                ).all()
-                
-                for conversation in conversations:
-                    conversation.display_flag = False
-                    updated_count += 1
-        
-        db.commit()
-        print(f"Updated display_flag to False for {updated_count} conversations")
-        
-    except Exception as e:
-        db.rollback()
-        print(f"Error updating display flags: {str(e)}")
-    finally:
-        db.close()
+                results = [generate_conversation_range(*args, users=users) for args in ranges]
+
+            print(f"Created {sum(r[0] for r in results)} conversations")
+            print(f"Created {sum(r[1] for r in results)} message records")
+
+            if defer_indexes:
+                build_indexes()
+                checkpoints.record("indexes", "done")
+            if fast_load:
+                verify_integrity()
+
+            if checkpoints is not None:
+                checkpoints.record(RUN_PHASE, "done")
+            print("Data generation completed successfully!")
+            if output_dir is None:
+                print(f"Connection pool: {get_metrics()}")
+
+        except Exception as e:
+            print(f"Error generating data: {str(e)}")
+            if db is not None:
+                db.rollback()
+            # Failed runs, and data failing the integrity or unique key
+            # checks in particular, must not look like a successful load
+            raise
+
+# Function to check and update display flags if needed
+def update_display_flags(dry_run=False):
+    """
+    Set internal_user_flag to False for internal users without a displayable
+    personnel record (missing, organization_type NULL or role_type in
+    EXCLUDE_ROLE_TYPE), and display_flag to False on their displayed
+    conversations. Runs as two set-based UPDATEs; with `dry_run` the affected
+    counts are only reported. Returns (user_count, conversation_count).
+    """
+    with session_scope() as db:
+        try:
+            print("Updating display flags for conversations...")
+
+            displayable_personnel = exists().where(
+                Personnel.external_username == User.username,
+                Personnel.organization_type.isnot(None),
+                or_(Personnel.role_type.is_(None), Personnel.role_type.notin_(EXCLUDE_ROLE_TYPE)),
+            )
+            users_to_hide = and_(User.internal_user_flag == True, ~displayable_personnel)
+            conversations_to_hide = and_(
+                Conversation.display_flag == True,  # Only update those currently set to True
+                Conversation.user_id.in_(select(User.external_id).where(users_to_hide)),
+            )
+
+            if dry_run:
+                user_count = db.scalar(select(func.count()).select_from(User).where(users_to_hide))
+                conversation_count = db.scalar(
+                    select(func.count()).select_from(Conversation).where(conversations_to_hide)
+                )
+                print(f"Dry run: would update {user_count} users and display_flag on {conversation_count} conversations")
+                return user_count, conversation_count
+
+            # Conversations first, while their users still have internal_user_flag set
+            conversation_count = db.execute(
+                update(Conversation)
+                .where(conversations_to_hide)
+                .values(display_flag=False)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            user_count = db.execute(
+                update(User)
+                .where(users_to_hide)
+                .values(internal_user_flag=False)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+
+            db.commit()
+            print(f"Updated internal_user_flag to False for {user_count} users")
+            print(f"Updated display_flag to False for {conversation_count} conversations")
+            return user_count, conversation_count
+
+        except Exception as e:
+            db.rollback()
+            print(f"Error updating display flags: {str(e)}")
 
 if __name__ == "__main__":
-    generate_data()
-    # Run validation to ensure all flags are properly set
-    update_display_flags()
+    parser = argparse.ArgumentParser(description="Generate fake data into the local database")
+    parser.add_argument("--profile", choices=list(PROFILES), default=DEFAULT_PROFILE,
+                        help="row counts and tuning, see profiles.py")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes generating conversations and messages in parallel (default: from profile)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="rows per INSERT batch (default: from profile)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="master seed every table and conversation range derives its own seed from")
+    parser.add_argument("--reference-time", type=datetime.fromisoformat, default=None, metavar="ISO",
+                        help="time generated timestamps are relative to, e.g. 2025-01-01T00:00:00 (default: now)")
+    parser.add_argument("--text-pool", type=int, default=0, metavar="N",
+                        help="sample topics and messages from a cached pool of N Faker texts")
+    parser.add_argument("--keep-tables", action="store_true",
+                        help="keep existing tables and upsert rows by external_id instead of recreating them")
+    parser.add_argument("--defer-indexes", action=argparse.BooleanOptionalAction, default=None,
+                        help="create bulk tables with primary keys only and build indexes after the load "
+                             "(default: from profile)")
+    parser.add_argument("--load-data", action="store_true",
+                        help="load personnel, users, conversations and messages with LOAD DATA LOCAL INFILE "
+                             "(needs local_infile=ON on the server, see docker-compose.yml)")
+    parser.add_argument("--fast-load", action="store_true",
+                        help="disable foreign key and unique checks while loading (MySQL), then verify integrity")
+    parser.add_argument("--output-dir", default=None, metavar="DIR",
+                        help="write every table as files under DIR instead of the database")
+    parser.add_argument("--output-format", choices=sorted(FILE_WRITERS), default="parquet",
+                        help="file format with --output-dir (parquet needs pyarrow)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last interrupted run from its checkpoints")
+    parser.add_argument("--flags-dry-run", action="store_true",
+                        help="only report how many display flags update_display_flags would change")
+    args = parser.parse_args()
+
+    generate_data(args.profile, writer_modes=LOAD_DATA_WRITER_MODES if args.load_data else None,
+                  workers=args.workers, batch_size=args.batch_size, seed=args.seed, reference_time=args.reference_time,
+                  text_pool_size=args.text_pool, drop_tables=not args.keep_tables, defer_indexes=args.defer_indexes,
+                  fast_load=args.fast_load, output_dir=args.output_dir, output_format=args.output_format,
+                  resume=args.resume)
+    if args.output_dir is None:
+        # Run validation to ensure all flags are properly set
+        update_display_flags(dry_run=args.flags_dry_run)
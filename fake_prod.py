@@ -1,6 +1,6 @@
 from faker import Faker
 from sqlalchemy.orm import Session
-from core.database_prod import SessionLocal, engine
+from core.database_prod import session_scope
 from model_prod import User, ChatModel, ChatConversation, ChatMessage, CategoryGroup, ChatParameter, ChatParameterGroup
 import random
 from datetime import datetime, timedelta
@@ -85,26 +85,24 @@ def create_chat_messages(db: Session, count: int = 100):
     return messages
 
 def main():
-    db = SessionLocal()
-    try:
-        users = create_users(db)
-        chat_models = create_chat_models(db)
-        conversations = create_chat_conversations(db)
-        messages = create_chat_messages(db)
+    with session_scope() as db:
+        try:
+            users = create_users(db)
+            chat_models = create_chat_models(db)
+            conversations = create_chat_conversations(db)
+            messages = create_chat_messages(db)
 
-        db.bulk_insert_mappings(User, users)
-        db.bulk_insert_mappings(ChatModel, chat_models)
-        db.bulk_insert_mappings(ChatConversation, conversations)
-        db.bulk_insert_mappings(ChatMessage, messages)
+            db.bulk_insert_mappings(User, users)
+            db.bulk_insert_mappings(ChatModel, chat_models)
+            db.bulk_insert_mappings(ChatConversation, conversations)
+            db.bulk_insert_mappings(ChatMessage, messages)
         
-        db.commit()
-        print("Fake data generated successfully!")
+            db.commit()
+            print("Fake data generated successfully!")
         
-    except Exception as e:
-        print(f"Error generating fake data: {e}")
-        db.rollback()
-    finally:
-        db.close()
+        except Exception as e:
+            print(f"Error generating fake data: {e}")
+            db.rollback()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,7 +2,7 @@ from datetime import datetime, timedelta
 from typing import Optional
 
 from core.database import Base
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Integer, String, Text
 from sqlalchemy.orm import Mapped, column_property, mapped_column, relationship
 from sqlalchemy.dialects.mysql import LONGTEXT
 from sqlalchemy.sql import func, select, text
@@ -18,7 +18,7 @@ class Message(Base):
     conversation_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("conversations.external_id"), nullable=False, index=True
     )
-    message: Mapped[str] = mapped_column(LONGTEXT, nullable=False)
+    message: Mapped[str] = mapped_column(Text().with_variant(LONGTEXT, "mysql", "mariadb"), nullable=False)
     is_bot: Mapped[bool] = mapped_column(Boolean, nullable=False, index=True)
     main_category: Mapped[str] = mapped_column(String(255), nullable=True)
     category_group: Mapped[str] = mapped_column(String(255), nullable=True)
@@ -216,4 +216,44 @@ class Department(Base):
     )
     external_division_code: Mapped[str] = mapped_column(String(3), nullable=False)
     branch: Mapped[str] = mapped_column(String(255), nullable=False)
-    abbreviation: Mapped[str] = mapped_column(String(255), nullable=False)
\ No newline at end of file
+    abbreviation: Mapped[str] = mapped_column(String(255), nullable=False)
+
+class SyncCheckpoint(Base):
+    __tablename__ = "sync_checkpoints"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    job: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
+    source_table: Mapped[str] = mapped_column(String(255), nullable=False)
+    watermark_column: Mapped[str] = mapped_column(String(255), nullable=False)
+    # High-water mark of the last committed chunk: the watermark column value
+    # when it is not the primary key, and the primary key as tie-breaker
+    last_value: Mapped[Optional[datetime]] = mapped_column(DateTime(6), nullable=True)
+    last_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    row_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, server_default=func.now(), onupdate=func.now(), nullable=False
+    )
+
+
+class RunState(Base):
+    __tablename__ = "run_states"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # "run" for the header of the run, a table name for the phase generating
+    # it, or "conversations:<start>" for one conversation range
+    phase: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
+    # "started" or "done"
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    seed: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    profile: Mapped[str] = mapped_column(String(255), nullable=False)
+    reference_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # Whether the run upserted into kept tables instead of recreating them;
+    # such runs cannot be resumed
+    kept_tables: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    # Last external_id and number of rows written by the phase; messages for
+    # conversation ranges
+    last_external_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    row_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, server_default=func.now(), onupdate=func.now(), nullable=False
+    )
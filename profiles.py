@@ -0,0 +1,125 @@
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from core.writer import DEFAULT_BATCH_SIZE
+from timeline import ActivityCurve, Gap
+
+
+@dataclass(frozen=True)
+class Profile:
+    """Row counts and tuning for one generate_data run"""
+
+    name: str
+    organizations: int
+    personnel: int
+    users: int
+    conversations: int
+    messages: int
+    # Rows per INSERT batch
+    batch_size: int = DEFAULT_BATCH_SIZE
+    # Conversations per unit of work handed to a worker process
+    conversation_range_size: int = 1000
+    # Worker processes generating conversations and messages
+    workers: int = 1
+    # Messages per conversation come in user/bot pairs drawn from
+    # normal(mean, pairs_stddev) clipped to [min_pairs, max_pairs], with the
+    # mean derived from messages / conversations
+    pairs_stddev: float = 5
+    min_pairs: int = 2
+    max_pairs: int = 100
+    # Excel sheet of departments to build organizations from, relative to
+    # the repository root; organizations are fully synthetic when unset
+    departments_file: Optional[str] = None
+    # How many personnel get a distinct abbreviation as branch name before
+    # the rest are drawn at random; every abbreviation when unset
+    distinct_branch_names: Optional[int] = None
+    # Create the bulk tables with primary keys only and build their indexes,
+    # unique keys and foreign keys in one pass after the load
+    defer_indexes: bool = False
+    # When conversations start, and the seconds between a user message and
+    # the bot reply and between a reply and the next user message
+    activity: ActivityCurve = ActivityCurve()
+    reply_gap: Gap = Gap("uniform", 30, 50)
+    turn_gap: Gap = Gap("lognormal", 60, 600, scale=180, sigma=0.7)
+
+    @property
+    def messages_per_conversation_block(self):
+        """Message external_ids reserved for each conversation"""
+        return 2 * self.max_pairs
+
+
+PROFILES = {
+    profile.name: profile
+    for profile in [
+        Profile(
+            name="small",
+            organizations=100,
+            personnel=400,
+            users=1000,
+            conversations=2500,
+            messages=10000,
+            batch_size=500,
+            conversation_range_size=250,
+            pairs_stddev=3,
+            max_pairs=20,
+            departments_file="test.xlsx",
+            distinct_branch_names=100,
+        ),
+        Profile(
+            name="medium",
+            organizations=200,
+            personnel=2000,
+            users=5000,
+            conversations=10000,
+            messages=200000,
+            batch_size=2000,
+        ),
+        Profile(
+            name="prod",
+            organizations=500,
+            personnel=5000,
+            users=15000,
+            conversations=25000,
+            messages=1000000,
+        ),
+        Profile(
+            name="10x",
+            organizations=5000,
+            personnel=50000,
+            users=150000,
+            conversations=250000,
+            messages=10000000,
+            batch_size=10000,
+            conversation_range_size=5000,
+            workers=4,
+            defer_indexes=True,
+        ),
+        Profile(
+            name="100x",
+            organizations=50000,
+            personnel=500000,
+            users=1500000,
+            conversations=2500000,
+            messages=100000000,
+            batch_size=10000,
+            conversation_range_size=10000,
+            workers=8,
+            defer_indexes=True,
+        ),
+    ]
+}
+
+DEFAULT_PROFILE = "prod"
+
+
+def get_profile(profile=DEFAULT_PROFILE, **overrides):
+    """
+    Look up a profile by name (or take a Profile as is) and apply any
+    non-None field overrides, e.g. get_profile("10x", workers=16)
+    """
+    if isinstance(profile, str):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile {profile!r}, expected one of {list(PROFILES)}")
+        profile = PROFILES[profile]
+    overrides = {key: value for key, value in overrides.items() if value is not None}
+    return replace(profile, **overrides) if overrides else profile
@@ -0,0 +1,143 @@
+import hashlib
+import sys
+
+import numpy as np
+
+from value import VALUE_WEIGHTS
+
+
+def derive_seed(seed, *keys):
+    """
+    Stable 64-bit sub-seed of `seed` for `keys`, e.g. derive_seed(seed,
+    "conversations", 12000). Unlike seed + offset, sub-seeds of different
+    keys or master seeds never line up, and they do not depend on the
+    Python process (no hash randomization).
+    """
+    digest = hashlib.blake2b(repr((seed, *keys)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class ColumnSampler:
+    """
+    Draws whole columns of categorical values at once with
+    numpy.random.Generator.choice, optionally weighted per value list.
+    """
+
+    def __init__(self, seed=None, weights=None):
+        self.rng = np.random.default_rng(seed)
+        self.weights = VALUE_WEIGHTS if weights is None else weights
+
+    def choice(self, values, size, weights=None):
+        """Return a list of `size` items of `values`, uniform unless weighted"""
+        p = None
+        if weights is not None:
+            if len(weights) != len(values):
+                raise ValueError(f"Expected {len(values)} weights, got {len(weights)}")
+            p = np.asarray(weights, dtype=float)
+            p = p / p.sum()
+        # Index rather than sample `values` directly, so tuples such as the
+        # FIELD_MAPPING pairs come back intact and types stay native Python
+        return [values[i] for i in self.rng.choice(len(values), size=size, p=p).tolist()]
+
+    def column(self, name, values, size):
+        """Like choice(), using the weights configured for `name` if any"""
+        return self.choice(values, size, self.weights.get(name))
+
+    def integers(self, low, high, size):
+        """`size` ints in [low, high], inclusive like random.randint"""
+        return self.rng.integers(low, high, size, endpoint=True).tolist()
+
+    def keys(self, pool, size):
+        """Draw `size` random rows of a KeyPool, returned as one list per column"""
+        index = self.rng.integers(0, len(pool), size)
+        return [column[index].tolist() for column in pool.columns]
+
+
+class InternedColumn:
+    """
+    Dictionary-encoded string column: an int32 code per row into an array of
+    distinct, interned values (None allowed). Repeated values such as
+    department codes or role types cost 4 bytes per row, and unlike a
+    fixed-width NumPy unicode array long values do not widen every row.
+    Indexing with a slice or an index array returns an object array.
+    """
+
+    def __init__(self, values):
+        index = {}
+        self.codes = np.fromiter(
+            (index.setdefault(sys.intern(v) if isinstance(v, str) else v, len(index)) for v in values),
+            dtype=np.int32,
+        )
+        self.values = np.empty(len(index), dtype=object)
+        self.values[:] = list(index)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.values[self.codes[index]]
+
+
+def _column(values):
+    """NumPy array of `values`, or an InternedColumn for strings"""
+    if isinstance(values, InternedColumn):
+        return values
+    array = np.asarray(values)
+    if array.dtype.kind in "UO":
+        return InternedColumn(array.tolist())
+    return array
+
+
+class KeyPool:
+    """
+    Foreign-key values of a parent table (plus any columns children copy from
+    it) held in parallel NumPy arrays, so children can sample parents in O(1)
+    per row without keeping ORM objects or rebuilding lists. String columns
+    are stored as InternedColumns.
+    """
+
+    def __init__(self, *columns):
+        self.columns = tuple(_column(column) for column in columns)
+        if len({len(column) for column in self.columns}) > 1:
+            raise ValueError("KeyPool columns must have the same length")
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def rows(self, start=0, stop=None):
+        """Iterate over the pool (or rows start:stop) as tuples of native Python values"""
+        return zip(*(column[start:stop].tolist() for column in self.columns))
+
+
+class UsernameAllocator:
+    """
+    Hands out unique usernames without rejection sampling: the first request
+    for a base gets the base itself, later ones base_1, base_2, ... from a
+    counter kept per base. A candidate already taken (e.g. "kim_1" requested
+    as a base of its own) only advances that base's counter, and each name
+    can block at most two (base, counter) pairs, so allocation is O(1)
+    amortized. Names longer than `max_length` are cut before the suffix.
+    """
+
+    def __init__(self, max_length=150):
+        self.max_length = max_length
+        self.used = set()
+        self.counters = {}
+
+    def _candidate(self, base, n):
+        suffix = f"_{n}" if n else ""
+        return base[:self.max_length - len(suffix)] + suffix
+
+    def reserve(self, name):
+        """Mark a name allocated elsewhere (e.g. a personnel username) as taken"""
+        self.used.add(name)
+
+    def allocate(self, base):
+        n = self.counters.get(base, 0)
+        name = self._candidate(base, n)
+        while name in self.used:
+            n += 1
+            name = self._candidate(base, n)
+        self.counters[base] = n + 1
+        self.used.add(name)
+        return name
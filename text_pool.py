@@ -0,0 +1,100 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+from faker import Faker
+
+# Paragraphs and sentences synthesized per locale
+DEFAULT_POOL_SIZE = 20000
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "text_pool")
+# Random indices drawn per NumPy call; sampling a single text is then a lookup
+INDEX_BLOCK_SIZE = 4096
+
+
+class TextPool:
+    """Pre-generated Faker paragraphs and sentences for one locale"""
+
+    def __init__(self, locale, paragraphs, sentences, word_connector=" "):
+        self.locale = locale
+        self.paragraphs = np.array(paragraphs, dtype=object)
+        self.sentences = np.array(sentences, dtype=object)
+        self.word_connector = word_connector
+
+    @classmethod
+    def build(cls, locale, size=DEFAULT_POOL_SIZE, seed=0):
+        faker = Faker(locale)
+        faker.seed_instance(seed)
+        return cls(
+            locale,
+            [faker.paragraph() for _ in range(size)],
+            [faker.sentence() for _ in range(size)],
+            # Japanese and Chinese join sentences without spaces
+            getattr(faker.provider("faker.providers.lorem"), "word_connector", " "),
+        )
+
+    @classmethod
+    def load(cls, locale, size=DEFAULT_POOL_SIZE, cache_dir=CACHE_DIR):
+        """Return the cached pool for the locale, building and caching it if needed"""
+        path = os.path.join(cache_dir, f"{locale}-{size}.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(locale, data["paragraphs"], data["sentences"], data["word_connector"])
+
+        print(f"Building text pool of {size} paragraphs and sentences for {locale}...")
+        pool = cls.build(locale, size)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write then rename, so concurrent loaders never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "paragraphs": pool.paragraphs.tolist(),
+                "sentences": pool.sentences.tolist(),
+                "word_connector": pool.word_connector,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return pool
+
+    def sampler(self, seed=None, splice=True):
+        return TextSampler(self, seed, splice)
+
+
+class TextSampler:
+    """
+    Faker-compatible paragraph()/sentence() drawing from a TextPool. With
+    `splice` a paragraph is joined from 1-4 pooled sentences, which gives far
+    more distinct paragraphs than the pool holds.
+    """
+
+    def __init__(self, pool, seed=None, splice=True):
+        self.pool = pool
+        self.rng = np.random.default_rng(seed)
+        self.splice = splice
+        self._indices = {}
+
+    def _next_index(self, key, n):
+        """Next random index in range(n) from the block buffered for `key`"""
+        block = self._indices.get(key)
+        if not block:
+            block = self.rng.integers(0, n, INDEX_BLOCK_SIZE).tolist()
+            # Pop from the end, so reverse to keep the drawn order
+            block.reverse()
+            self._indices[key] = block
+        return block.pop()
+
+    def sentence(self):
+        return self.pool.sentences[self._next_index("sentence", len(self.pool.sentences))]
+
+    def paragraph(self):
+        if not self.splice:
+            return self.pool.paragraphs[self._next_index("paragraph", len(self.pool.paragraphs))]
+        # Faker varies nb_sentences=3 by +/-40%, giving 1-4 sentences
+        count = 1 + self._next_index("nb_sentences", 4)
+        return self.pool.word_connector.join(self.sentence() for _ in range(count))
+
+
+@lru_cache(maxsize=None)
+def load_text_pool(locale, size=DEFAULT_POOL_SIZE):
+    """Process-wide cached TextPool.load"""
+    return TextPool.load(locale, size)
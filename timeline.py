@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Sequence, Tuple
+
+import numpy as np
+
+SECONDS_PER_HOUR = 3600
+
+# Relative activity per hour of the day (0-23) and per weekday (Monday
+# first): quiet nights, office-hours peaks around late morning and mid
+# afternoon, a smaller evening bump and lighter weekends
+DIURNAL_WEIGHTS = (2, 1, 1, 1, 1, 2, 4, 8, 14, 20, 24, 24, 18, 22, 24, 22, 20, 16, 12, 12, 12, 10, 6, 4)
+WEEKDAY_WEIGHTS = (1.0, 1.0, 1.0, 1.0, 0.95, 0.55, 0.45)
+
+GAP_DISTRIBUTIONS = ("uniform", "exponential", "lognormal")
+
+
+@dataclass(frozen=True)
+class Gap:
+    """
+    Distribution of the whole seconds between two events: "uniform" in
+    [low, high], "exponential" with mean `scale` or "lognormal" with median
+    `scale` and shape `sigma`. Exponential and lognormal draws are clipped
+    to [low, high].
+    """
+
+    distribution: str = "uniform"
+    low: int = 0
+    high: int = 60
+    scale: float = 60
+    sigma: float = 1.0
+
+    def __post_init__(self):
+        if self.distribution not in GAP_DISTRIBUTIONS:
+            raise ValueError(f"Unknown gap distribution {self.distribution!r}, expected one of {GAP_DISTRIBUTIONS}")
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """`size` gaps in seconds as int64"""
+        if self.distribution == "uniform":
+            return rng.integers(self.low, self.high, size, endpoint=True)
+        if self.distribution == "exponential":
+            seconds = rng.exponential(self.scale, size)
+        else:
+            seconds = self.scale * rng.lognormal(0, self.sigma, size)
+        return np.clip(np.rint(seconds), self.low, self.high).astype(np.int64)
+
+
+@dataclass(frozen=True)
+class ActivityCurve:
+    """
+    How likely an event is to start in each hour, as the product of an
+    hour-of-day weight and a weekday weight. Equal weights give uniform
+    times like Faker's date_time_between.
+    """
+
+    hourly: Tuple[float, ...] = DIURNAL_WEIGHTS
+    weekday: Tuple[float, ...] = WEEKDAY_WEIGHTS
+
+    def __post_init__(self):
+        if len(self.hourly) != 24 or len(self.weekday) != 7:
+            raise ValueError("ActivityCurve needs 24 hourly and 7 weekday weights")
+
+    def sample(self, rng: np.random.Generator, start: datetime, end: datetime, size: int) -> np.ndarray:
+        """`size` datetime64[s] times in [start, end), drawn for all at once"""
+        start = np.datetime64(start, "s").astype(np.int64)
+        end = np.datetime64(end, "s").astype(np.int64)
+        # Every hour overlapping [start, end), cut to the interval at both ends
+        hours = np.arange(start // SECONDS_PER_HOUR, -(-end // SECONDS_PER_HOUR)) * SECONDS_PER_HOUR
+        lows = np.maximum(hours, start)
+        lengths = np.minimum(hours + SECONDS_PER_HOUR, end) - lows
+
+        days = hours // (24 * SECONDS_PER_HOUR)
+        hour_of_day = (hours // SECONDS_PER_HOUR) % 24
+        # 1970-01-01 was a Thursday
+        weekday = (days + 3) % 7
+        weights = np.asarray(self.hourly, dtype=float)[hour_of_day] * np.asarray(self.weekday, dtype=float)[weekday]
+        weights *= lengths
+        picks = rng.choice(len(hours), size, p=weights / weights.sum())
+
+        seconds = lows[picks] + (rng.random(size) * lengths[picks]).astype(np.int64)
+        return seconds.astype("datetime64[s]")
+
+
+def thread_times(starts, counts, gaps: Sequence[Gap], rng: np.random.Generator) -> np.ndarray:
+    """
+    Timestamps of the events of consecutive threads, flattened: thread i has
+    counts[i] events from starts[i], and the k-th gap within a thread is
+    drawn from gaps[k % len(gaps)], e.g. (reply gap, next-turn gap) for
+    user/bot message pairs. Gaps are sampled per distribution for all
+    threads at once and turned into offsets with one cumulative sum.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype="datetime64[s]")
+    first = np.cumsum(counts) - counts
+    position = np.arange(total) - np.repeat(first, counts)
+
+    deltas = np.zeros(total, dtype=np.int64)
+    for i, gap in enumerate(gaps):
+        # Gap before each event but the first of its thread
+        mask = (position > 0) & ((position - 1) % len(gaps) == i)
+        deltas[mask] = gap.sample(rng, int(mask.sum()))
+    offsets = np.cumsum(deltas)
+    offsets -= np.repeat(offsets[first], counts)
+
+    starts = np.asarray(starts).astype("datetime64[s]")
+    return np.repeat(starts, counts) + offsets.astype("timedelta64[s]")
@@ -197,4 +197,29 @@ EXCLUDE_ROLE_TYPE = [
     "パートその他",
     "事務スタッフ",
     "事務スタッフ（フル）",
-]
\ No newline at end of file
+]
+
+ORG_TYPES = ["本社", "営業", "各支店", "その他"]
+
+REGIONS = ["東京", "大阪", "名古屋", "福岡", "札幌", "仙台", "広島", "京都"]
+
+YES_NO = ["はい", "いいえ"]
+
+MODEL_IDS = [3, 4, 5]
+
+# Optional sampling weights for the value lists above, keyed by column and in
+# the same order as the list. Columns left out (or None) are sampled
+# uniformly. Fill these from production counts to match its distribution.
+VALUE_WEIGHTS = {
+    "role_type": None,
+    "employee_type": None,
+    "abbreviation": None,
+    "field_mapping": None,
+    "insurance_category": None,
+    "organization_type": None,
+    "region": None,
+    "is_organization_head": None,
+    "is_department_head": None,
+    "model_id": None,
+    "external_id_delete_flag": None,
+}